@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+from configparser import ConfigParser
+from composites import Composites
+from transitions import Transitions, Transition, TransitionPlayer, L, T, R, B
+import transitions
+import testtransition
+import numpy as np
+import copy
+import tracemalloc
+import os
+import sys
+import time
+import json
+import platform
+import subprocess
+import argparse
+import logging
+
+# default output sizes to measure
+Sizes = ['240x135', '640x360', '1280x720', '1920x1080', '3840x2160']
+
+# default numbers of synthetic composites to measure besides composite.ini
+Counts = [25, 50, 100]
+
+# default numbers of key composites per transition to calculate
+Keys = [2, 3, 4, 5]
+
+# all benchmarks in the order they run
+Benchmarks = ['import', 'composites', 'transitions', 'allocations',
+              'calculate', 'splines', 'precision', 'find', 'play', 'retarget',
+              'render']
+
+# modules measured by the import benchmark
+Modules = ['frame', 'composites', 'transitions']
+
+# heavy modules which shall only be imported when really needed
+LAZY_MODULES = ['scipy', 'multiprocessing']
+
+
+# path sampling precisions in pixels to measure (None is the fixed sampling)
+PRECISIONS = [None, 1.0, 0.5]
+
+# precision of the reference the frames of all PRECISIONS are compared with
+REFERENCE_PRECISION = 0.001
+
+# maximum seconds TransitionPlayer.composite() may take per frame
+PLAY_BUDGET = 5e-6
+
+# maximum seconds TransitionPlayer.switch() may take to retarget a running
+# transition in RETARGET_PERCENTILE percent of all cases
+RETARGET_BUDGET = 1e-3
+RETARGET_PERCENTILE = 99
+
+
+def read_arguments():
+    global Args
+    # read arguments
+    __all__ = ['Args']
+    parser = argparse.ArgumentParser(
+        description='benchmark - measure the performance of voctomix composites, transitions and rendering')
+    parser.add_argument('benchmark', nargs='*',
+                        help="benchmarks to run out of %s (run all if not given)" %
+                        ", ".join(Benchmarks))
+    parser.add_argument('-s', '--sizes', metavar='WxH', nargs='+', default=Sizes,
+                        help="output sizes to measure (default: %s)" % " ".join(Sizes))
+    parser.add_argument('-n', '--counts', metavar='N', type=int, nargs='+', default=Counts,
+                        help="numbers of synthetic composites to measure besides composite.ini (default: %s)" %
+                        " ".join([str(n) for n in Counts]))
+    parser.add_argument('-k', '--keys', metavar='N', type=int, nargs='+', default=Keys,
+                        help="numbers of key composites to calculate transitions from (default: %s)" %
+                        " ".join([str(n) for n in Keys]))
+    parser.add_argument('-r', '--repeat', metavar='N', type=int, default=3,
+                        help="repeat every measurement N times and keep the best one (default: 3)")
+    parser.add_argument('-o', '--output', metavar='FILE', default='benchmark.json',
+                        help="write results into FILE (default: benchmark.json)")
+    parser.add_argument('-c', '--compare', metavar='FILE',
+                        help="compare results with the ones of a previous run stored in FILE")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="also print WARNING (-v), INFO (-vv) and DEBUG (-vvv) messages")
+    Args = parser.parse_args()
+    for benchmark in Args.benchmark:
+        if benchmark not in Benchmarks:
+            parser.error("unknown benchmark '%s'" % benchmark)
+
+
+def init_log():
+    global Args, log
+    # set up logging
+    FORMAT = '%(message)s'
+    logging.basicConfig(format=FORMAT)
+    logging.root.setLevel([logging.ERROR, logging.WARNING,
+                           logging.INFO, logging.DEBUG][Args.verbose])
+    log = logging.getLogger('Benchmark')
+
+
+def read_config(filename):
+    """ return composites and transitions configuration items and frames per
+        second from configuration file <filename>
+    """
+    config = ConfigParser()
+    config.read(filename)
+    return (config.items('composites'), config.items('transitions'),
+            int(config.get('output', 'fps')))
+
+
+def synthetic(n):
+    """ return configuration items of <n> generated side-by-side composites
+        placed on a grid and of transitions between neighbours and between
+        all of them by wildcards
+    """
+    composites = []
+    transitions = []
+    for i in range(n):
+        # place A and B on two grids of 10x10 positions
+        x, y = (i % 10) * 0.005, (i // 10 % 10) * 0.005 + i // 100 * 0.001
+        composites += [("g%d.a" % i, "%.3f/%.3f 0.45x0.45" % (x, y)),
+                       ("g%d.b" % i, "%.3f/%.3f 0.45x0.45" % (0.5 + x, 0.5 - y))]
+        transitions += [("g%d-g%d" % (i, (i + 1) % n),
+                         "750, g%d / g%d" % (i, (i + 1) % n))]
+    transitions += [("any", "750, * / *")]
+    return composites, transitions
+
+
+def key_composites(targets, n):
+    """ return <n> of the given <targets> in a row where neighbours differ in
+        both of the corners which get interpolated (see Transition.calculate())
+    """
+    keys = [targets[0]]
+    i = 0
+    while len(keys) < n:
+        for i in range(i + 1, i + len(targets)):
+            c = targets[i % len(targets)]
+            if (c.A().corner(R, T) != keys[-1].A().corner(R, T) and
+                    c.B().corner(L, T) != keys[-1].B().corner(L, T)):
+                break
+        keys.append(c)
+    return keys
+
+
+def measure(function, repeat):
+    """ call <function> <repeat> times and return the best duration in
+        seconds and the result of its last call
+    """
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def record(results, benchmark, size, composites, seconds, count=1, **params):
+    """ append a result of <benchmark> which did <count> operations within
+        <seconds> to <results> and print it
+    """
+    results.append({'benchmark': benchmark,
+                    'size': "%dx%d" % tuple(size),
+                    'composites': composites,
+                    'params': params,
+                    'seconds': seconds,
+                    'count': count,
+                    'rate': count / seconds if seconds else None})
+    print("%-22s %9s %4s %-32s %10.3f ms %12.1f /s" %
+          (benchmark, results[-1]['size'], composites,
+           " ".join(["%s=%s" % p for p in sorted(params.items())]),
+           seconds * 1000, results[-1]['rate'] or 0))
+
+
+def without_wildcards(transitions_cfg):
+    return [(n, t) for n, t in transitions_cfg if '*' not in t]
+
+
+def bench_composites(results, size, name, composites_cfg, transitions_cfg, fps):
+    seconds, composites = measure(
+        lambda: Composites.configure(composites_cfg, size), Args.repeat)
+    record(results, 'composites.configure', size, name, seconds,
+           len(composites))
+
+
+def bench_transitions(results, size, name, composites_cfg, transitions_cfg, fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    # calculate explicitly configured transitions
+    seconds, transitions = measure(
+        lambda: Transitions.configure(without_wildcards(transitions_cfg),
+                                      composites, targets, fps), Args.repeat)
+    record(results, 'transitions.configure', size, name, seconds,
+           transitions.count(), wildcards=False, lazy=False)
+    # wildcards of synthetic composites expand into too many transitions to
+    # calculate them all so only build their table
+    lazy = type(name) is int
+    seconds, transitions = measure(
+        lambda: Transitions.configure(transitions_cfg, composites, targets,
+                                      fps, lazy), Args.repeat)
+    record(results, 'transitions.configure', size, name, seconds,
+           transitions.count(), wildcards=True, lazy=lazy)
+
+
+def bench_allocations(results, size, name, composites_cfg, transitions_cfg,
+                      fps):
+    if type(name) is int:
+        transitions_cfg = without_wildcards(transitions_cfg)
+    # count deep copies and trace memory while configuring everything
+    deepcopies = 0
+    deepcopy = copy.deepcopy
+
+    def counting(x, memo=None):
+        nonlocal deepcopies
+        deepcopies += 1
+        return deepcopy(x, memo)
+    copy.deepcopy = counting
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        composites = Composites.configure(composites_cfg, size)
+        targets = Composites.targets(composites)
+        transitions = Transitions.configure(transitions_cfg, composites,
+                                            targets, fps)
+        seconds = time.perf_counter() - start
+        blocks = sum(s.count for s in
+                     tracemalloc.take_snapshot().statistics('filename'))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        copy.deepcopy = deepcopy
+    record(results, 'transitions.allocations', size, name, seconds,
+           transitions.count())
+    results[-1].update({'deepcopies': deepcopies, 'blocks': blocks,
+                        'peak': peak})
+    log.info("configuring %d composites and %d transitions deep-copies %d "
+             "objects and keeps %d memory blocks (%d KiB at peak)" %
+             (len(composites), transitions.count(), deepcopies, blocks,
+              peak // 1024))
+    # frozen frames are shared so only the ones being parsed may be copied
+    frames = sum(c.sources() for c in composites.values())
+    if deepcopies > frames:
+        log.error("configuring deep-copies %d objects which is more than the "
+                  "%d frames of all composites" % (deepcopies, frames))
+
+
+def bench_calculate(results, size, name, composites_cfg, transitions_cfg, fps):
+    targets = Composites.targets(Composites.configure(composites_cfg, size))
+    for keys in Args.keys:
+        def calculate():
+            transition = Transition("benchmark")
+            for composite in key_composites(targets, keys):
+                transition.append(composite)
+            transition.calculate(int(fps * 0.75) - 1)
+            return transition
+        seconds, transition = measure(calculate, Args.repeat)
+        record(results, 'transition.calculate', size, name, seconds,
+               transition.frames(), keys=keys)
+
+
+def bench_import(results, size, name, composites_cfg, transitions_cfg, fps):
+    for module in Modules:
+        def load():
+            # import within a new interpreter like every program does and
+            # read the cumulative time of the module from '-X importtime'
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c',
+                 "import sys, %s; print(' '.join(sys.modules))" % module],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+            seconds = None
+            for line in process.stderr.splitlines():
+                if line.split('|')[-1].strip() == module:
+                    seconds = int(line.split('|')[1]) * 1e-6
+            return seconds, process.stdout.split()
+        best = None
+        for r in range(Args.repeat):
+            seconds, modules = load()
+            best = seconds if best is None else min(best, seconds)
+        record(results, 'import', size, name, best, module=module)
+        log.info("importing '%s' imports %d modules" % (module, len(modules)))
+        for lazy in LAZY_MODULES:
+            if lazy in modules:
+                log.error("importing '%s' also imports '%s'" % (module, lazy))
+
+
+def bench_splines(results, size, name, composites_cfg, transitions_cfg, fps):
+    targets = Composites.targets(Composites.configure(composites_cfg, size))
+    u = np.linspace(0, 1, 1001)
+    try:
+        import scipy.interpolate
+        splines = [False, True]
+    except ImportError:
+        log.warning("SciPy is not available to cross-check splines")
+        splines = [False]
+    for keys in Args.keys:
+        if keys < 3:
+            continue
+        composites = key_composites(targets, keys)
+        paths = [np.array([c.A().corner(R, T) for c in composites]),
+                 np.array([c.B().corner(L, T) for c in composites])]
+        points = dict()
+        for use_scipy in splines:
+            def fit():
+                return [transitions.evaluate(
+                    transitions.fit(p, use_scipy), p, u, use_scipy)
+                    for p in paths]
+            seconds, points[use_scipy] = measure(fit, Args.repeat)
+            record(results, 'transitions.fit', size, name, seconds,
+                   len(paths), keys=keys,
+                   spline='scipy' if use_scipy else 'numpy')
+        if True in points:
+            difference = np.abs(np.array(points[False]) -
+                                np.array(points[True])).max()
+            log.info("NumPy splines of %d keys differ by %.3g pixels at most "
+                     "from SciPy's ones" % (keys, difference))
+            if difference:
+                log.error("NumPy splines of %d keys differ by %.3g pixels "
+                          "from SciPy's ones instead of being equal" %
+                          (keys, difference))
+
+
+def bench_precision(results, size, name, composites_cfg, transitions_cfg,
+                    fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    table = Transitions.configure(transitions_cfg, composites, targets, fps)
+    found = list({id(t): t for tt in table.transitions for t in tt
+                  if t}.values())
+
+    def calculate(precision):
+        # calculate every distinct transition of the table again and return
+        # the rectangles of all their frames
+        frames = []
+        for t in found:
+            transition = Transition(t._name, t.keys())
+            transition.easing = t.easing
+            transition.calculate(t.frames(), precision=precision)
+            frames.append(transition.composites.data[:, :, L:B + 1])
+        return np.concatenate(frames)
+    reference = calculate(REFERENCE_PRECISION)
+    # take turns between the precisions so that they all suffer alike from
+    # any load of the machine
+    seconds, frames = dict(), dict()
+    for r in range(Args.repeat):
+        for precision in PRECISIONS:
+            duration, frames[precision] = measure(
+                lambda: calculate(precision), 1)
+            seconds[precision] = min(seconds.get(precision, duration),
+                                     duration)
+    for precision in PRECISIONS:
+        record(results, 'transition.precision', size, name,
+               seconds[precision], len(frames[precision]),
+               precision=precision)
+        error = np.abs(frames[precision] - reference).max()
+        log.info("frames sampled with precision %s differ by %.3f pixels at "
+                 "most from the ones of precision %s" %
+                 (precision, error, REFERENCE_PRECISION))
+        if precision is None:
+            continue
+        if error > precision:
+            log.error("frames sampled with precision %s differ by %.3f "
+                      "pixels which is more than that" % (precision, error))
+        if seconds[precision] > seconds[None]:
+            log.error("transitions sampled with precision %s take %.1f ms "
+                      "which is more than %.1f ms of the fixed sampling" %
+                      (precision, seconds[precision] * 1e3,
+                       seconds[None] * 1e3))
+
+
+def bench_find(results, size, name, composites_cfg, transitions_cfg, fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    if type(name) is int:
+        transitions_cfg = without_wildcards(transitions_cfg)
+    transitions = Transitions.configure(transitions_cfg, composites, targets,
+                                        fps)
+
+    def find():
+        for begin in targets:
+            for end in targets:
+                transitions.find(begin, end)
+    seconds, _ = measure(find, Args.repeat)
+    record(results, 'transitions.find', size, name, seconds,
+           len(targets) ** 2)
+
+
+def bench_play(results, size, name, composites_cfg, transitions_cfg, fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    transitions = Transitions.configure(transitions_cfg, composites, targets,
+                                        fps)
+    sequence = [composites[c] for c in
+                Transitions.travel([t.name for t in targets])]
+    # play the tester's sequence in time or by calling late every 2.5 frames
+    for step in [1.0, 2.5]:
+        player = TransitionPlayer(transitions, sequence[0], fps)
+        # switch and play all transitions and measure time spent in both
+        switching = 0.0
+        playing = 0.0
+        calls = 0
+        timestamp = 0.0
+        for target in sequence[1:]:
+            start = time.perf_counter()
+            player.switch(target, timestamp)
+            switching += time.perf_counter() - start
+            while player.running():
+                start = time.perf_counter()
+                player.composite(timestamp)
+                playing += time.perf_counter() - start
+                calls += 1
+                timestamp += step / fps
+        record(results, 'player.switch', size, name, switching,
+               len(sequence) - 1, step=step)
+        record(results, 'player.composite', size, name, playing, calls,
+               step=step)
+        if playing / calls > PLAY_BUDGET:
+            log.error("TransitionPlayer.composite() takes %.1f us per frame "
+                      "which is more than %.1f us" %
+                      (playing / calls * 1e6, PLAY_BUDGET * 1e6))
+
+
+def bench_retarget(results, size, name, composites_cfg, transitions_cfg,
+                   fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    transitions = Transitions.configure(transitions_cfg, composites, targets,
+                                        fps)
+    sequence = [composites[c] for c in
+                Transitions.travel([t.name for t in targets])]
+
+    def retarget():
+        player = TransitionPlayer(transitions, sequence[0], fps)
+        # switch to every target of the tester's sequence and retarget to the
+        # next one when half of the transition has been played
+        retargeting = []
+        jump = 0.0
+        timestamp = 0.0
+        for target, next_target in zip(sequence[1:], sequence[2:]):
+            if not player.switch(target, timestamp):
+                continue
+            for n in range(len(player.frames) // 2):
+                player.composite(timestamp)
+                timestamp += 1.0 / fps
+            frames, i = player.frames, player.last
+            start = time.perf_counter()
+            retargeted = player.switch(next_target, timestamp)
+            retargeting.append(time.perf_counter() - start)
+            if retargeted:
+                # compare the first step with the one we would have done
+                v = np.array([frames[i + 1].A().corner(R, T),
+                              player.frames[1].A().corner(R, T)],
+                             dtype=float)
+                jump = max(jump, np.sqrt(((v[1] - v[0])**2).sum()))
+            while player.running():
+                player.composite(timestamp)
+                timestamp += 1.0 / fps
+        return retargeting, jump
+    # warm up and keep the best duration of every retargeting
+    retargeting, jump = retarget()
+    for r in range(Args.repeat):
+        retargeting = np.minimum(retargeting, retarget()[0])
+    if not len(retargeting):
+        return
+    record(results, 'player.retarget', size, name, sum(retargeting),
+           len(retargeting))
+    log.info("first retargeted steps differ by %.2f pixels at most from the "
+             "ones without retargeting" % jump)
+    log.info("retargeting takes %.3f ms in median and %.3f ms at most" %
+             (np.median(retargeting) * 1e3, max(retargeting) * 1e3))
+    percentile = np.percentile(retargeting, RETARGET_PERCENTILE)
+    if percentile > RETARGET_BUDGET:
+        log.error("TransitionPlayer.switch() takes %.3f ms to retarget in %d%% "
+                  "of all cases which is more than %.3f ms" %
+                  (percentile * 1e3, RETARGET_PERCENTILE,
+                   RETARGET_BUDGET * 1e3))
+
+
+def bench_render(results, size, name, composites_cfg, transitions_cfg, fps):
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    transitions = Transitions.configure(transitions_cfg, composites, targets,
+                                        fps)
+    # render the first transitions of the tester's sequence
+    sequence = Transitions.travel([t.name for t in targets])
+    found = [transitions.find(composites[a], composites[b])
+             for a, b in zip(sequence, sequence[1:])]
+    found = [t for t in found if t][:4]
+    for backend in sorted(testtransition.Rasters):
+        # render like 'testtransition.py -g -t -k -c -b <backend>' would
+        testtransition.Args = argparse.Namespace(
+            backend=backend, title=1, keys=1, corners=1, cross=0, crop=0)
+
+        def render():
+            frames = 0
+            for transition in found:
+                for image in testtransition.draw_transition(size, transition):
+                    frames += 1
+            return frames
+        seconds, frames = measure(render, Args.repeat)
+        record(results, 'testtransition.render', size, name, seconds, frames,
+               backend=backend)
+
+
+def run(sizes, counts):
+    """ run all selected benchmarks and return their results
+    """
+    results = []
+    configs = [("ini",) + read_config("composite.ini")]
+    fps = configs[0][3]
+    configs += [(n,) + synthetic(n) + (fps,) for n in counts]
+    # import everything needed for calculation before measuring
+    warm_up = Transition("warm up")
+    for composite in key_composites(Composites.targets(
+            Composites.configure(configs[0][1], sizes[0])), 3):
+        warm_up.append(composite)
+    warm_up.calculate(fps)
+    for benchmark in Args.benchmark or Benchmarks:
+        function = globals()['bench_' + benchmark]
+        for size in sizes:
+            for config in configs:
+                # calculation and rendering do not depend on the number of
+                # configured composites
+                if (benchmark in ['import', 'calculate', 'splines',
+                                  'precision', 'play', 'retarget',
+                                  'render'] and
+                        config[0] != "ini"):
+                    continue
+                # importing does not even depend on the size
+                if benchmark == 'import' and size != sizes[0]:
+                    continue
+                function(results, size, *config)
+    return results
+
+
+def environment():
+    """ return a description of the environment the benchmark runs within
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit or None,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': Args.repeat}
+
+
+def key(result):
+    return (result['benchmark'], result['size'], str(result['composites']),
+            json.dumps(result['params'], sort_keys=True))
+
+
+def compare(results, filename):
+    """ print how the durations of <results> changed against the results
+        stored in <filename>
+    """
+    with open(filename) as file:
+        previous = json.load(file)
+    print("\ncompared to commit %s of %s:" %
+          (previous['environment']['commit'], previous['environment']['date']))
+    durations = {key(r): r['seconds'] for r in previous['results']}
+    allocations = {key(r): r for r in previous['results'] if 'deepcopies' in r}
+    for r in results:
+        before = durations.get(key(r))
+        if before:
+            print("%-22s %9s %4s %-32s %10.3f ms %10.3f ms %6.2fx" %
+                  (r['benchmark'], r['size'], r['composites'],
+                   " ".join(["%s=%s" % p for p in sorted(r['params'].items())]),
+                   before * 1000, r['seconds'] * 1000, before / r['seconds']))
+        if key(r) in allocations and 'deepcopies' in r:
+            a = allocations[key(r)]
+            for count, title in [('deepcopies', "deep copies"),
+                                 ('blocks', "memory blocks")]:
+                print("%-22s %9s %4s %-32s %10d    %10d    %s" %
+                      (r['benchmark'], r['size'], r['composites'], "",
+                       a[count], r[count], title))
+
+
+if __name__ == "__main__":
+    read_arguments()
+    init_log()
+    testtransition.log = log
+    sizes = [[int(v) for v in s.split('x')] for s in Args.sizes]
+    results = run(sizes, Args.counts)
+    with open(Args.output, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file,
+                  indent=1)
+    print("results written into '%s'" % Args.output)
+    if Args.compare:
+        compare(results, Args.compare)
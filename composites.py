@@ -1,14 +1,25 @@
 # for debug logging
 import logging
 # use Frame
-from frame import Frame, X, Y, L, T, R, B
+from frame import Frame, FrozenFrame, X, Y, L, T, R, B
 # for cloning objects
 import copy
 # for parsing configuration items
 import re
+# for reading pre-parsed configurations
+import json
 
 log = logging.getLogger('Composites')
 
+# placeholders used in composite signatures for frames which can not be seen
+COVERED, INVISIBLE = "covered", "invisible"
+
+# letters sources are configured with (a, b, c, ...) by their index
+SOURCES = "abcdefghijklmnopqrstuvwxyz"
+
+# attributes of a source (e.g. 'b' or 'crop-b') and their source letter
+SOURCE_ATTRIBUTE = re.compile(r'^(?:(crop|default|alpha)-)?([a-z])$')
+
 
 class Composites:
     """ a namespace for composite related methods
@@ -21,6 +32,8 @@ class Composites:
         """
         # prepare resulting composites dictonary
         composites = dict()
+        # names of the first composites which configure each source
+        configured = dict()
         # walk through composites configuration
         for c_name, c_val in cfg:
             if '.' not in c_name:
@@ -32,6 +45,9 @@ class Composites:
             if name not in composites:
                 # add  new composite
                 composites[name] = Composite(len(composites), name)
+            r = SOURCE_ATTRIBUTE.match(attr)
+            if r:
+                configured.setdefault(SOURCES.index(r.group(2)), name)
             try:
                 # set attribute
                 composites[name].config(attr, c_val, size)
@@ -39,48 +55,85 @@ class Composites:
                 raise RuntimeError(
                     "syntax error in composite config value at '{}':\n{}"
                     .format(name, err))
+        # give all composites as many sources as the one with the most so that
+        # all of them can be interpolated into each other
+        sources = max([c.sources() for c in composites.values()], default=2)
+        # every source beyond A and B must be configured by some composite so
+        # that a mistyped letter does not silently add sources
+        missing = [SOURCES[n].upper() for n in range(2, sources)
+                   if n not in configured]
+        if missing:
+            raise ValueError(
+                "source {} configured at '{}' but source(s) {} are not "
+                "configured in any composite"
+                .format(SOURCES[sources - 1].upper(),
+                        configured[sources - 1], ", ".join(missing)))
+        # composites are complete so make their frames immutable
+        for c in composites.values():
+            c.resize(sources, size)
+            c.freeze()
         if add_swap:
             # add any useful swapped targets
             add_swapped_targets(composites)
         return composites
 
+    def load(data, size, add_swap=True):
+        """ return all composites defined in the pre-parsed structure <data>
+            which maps composite names to dictionaries of attributes and
+            their values like {"pip": {"a": "*", "b": [0.8, 0.8, 1.0, 1.0]}}
+            (a JSON string of it is accepted as well). Values may be given
+            like in configure() or as numbers (see Composite.config()).
+        """
+        if type(data) is str:
+            data = json.loads(data)
+        return Composites.configure([("%s.%s" % (name, attr), value)
+                                     for name, attrs in data.items()
+                                     for attr, value in attrs.items()],
+                                    size, add_swap)
+
     def targets(composites):
         """ return a list of all composites that are not intermediate
         """
-        result = []
-        for c_name, c in composites.items():
-            if not c.inter:
-                result.append(c)
-        return sorted(result, key=lambda c: c.order)
+        # composites are usually stored in order already which makes
+        # sorting linear
+        return sorted([c for c in composites.values() if not c.inter],
+                      key=lambda c: c.order)
 
     def intermediates(composites):
         """ return a list of all composites that are intermediate
         """
-        result = []
-        for c_name, c in composites.items():
-            if c.inter:
-                result.append(c)
-        return sorted(result, key=lambda c: c.order)
+        return sorted([c for c in composites.values() if c.inter],
+                      key=lambda c: c.order)
 
 
 class Composite:
 
-    def __init__(self, order, name, a=Frame(True), b=Frame(True)):
+    __slots__ = ('name', 'frame', 'default', 'inter', 'noswap', 'order')
+
+    def __init__(self, order, name, a=Frame(True), b=Frame(True), *more):
+        """ create composite of frames <a>, <b> and any <more> sources
+            (C, D, ...) which are placed above each other in that order
+        """
         assert type(order) is int or order is None
         assert type(name) is str or not name
         self.name = name
-        self.frame = [copy.deepcopy(a), copy.deepcopy(b)]
-        self.default = [None, None]
+        # frozen frames can be shared, all others need to be copied
+        self.frame = [f if type(f) is FrozenFrame else copy.deepcopy(f)
+                      for f in (a, b) + more]
+        self.default = [None] * len(self.frame)
         self.inter = False
         self.noswap = False
         self.order = order
 
-    def str_title():
-        return "Key A%s\tB%s  Name" % (Frame.str_title(), Frame.str_title())
+    def str_title(sources=2):
+        return "Key %s  Name" % "\t".join(
+            [SOURCES[i].upper() + Frame.str_title() for i in range(sources)])
 
     def __str__(self):
-        return "%s A%s\tB%s  %s" % (" * " if self.A().key else "   ",
-                                    self.A(), self.B(), self.name)
+        return "%s %s  %s" % (" * " if self.A().key else "   ",
+                              "\t".join([SOURCES[i].upper() + str(f)
+                                         for i, f in enumerate(self.frame)]),
+                              self.name)
 
     def equals(self, other, treat_covered_as_invisible):
         """ compare two composites if they are looking the same
@@ -89,24 +142,54 @@ class Composite:
         """
         if not (self.A() == other.A() or (treat_covered_as_invisible and self.covered() and other.covered())):
             return False
-        elif not (self.B() == other.B() or (self.B().invisible() and other.B().invisible())):
-            return False
+        # all sources above A are compared like B
+        for f, o in zip(self.frame[1:], other.frame[1:]):
+            if not (f == o or (f.invisible() and o.invisible())):
+                return False
         return True
 
+    def signature(self):
+        """ return a hashable key which is equal for all composites which
+            are looking the same in the sense of
+            equals(other, treat_covered_as_invisible=True)
+        """
+        # a covered A looks like any other covered A
+        a = COVERED if self.covered() else self.A().signature()
+        # an invisible B (or C, D, ...) looks like any other invisible one
+        return (a,) + tuple(INVISIBLE if f.invisible() else f.signature()
+                            for f in self.frame[1:])
+
     def A(self):
         return self.frame[0]
 
     def B(self):
         return self.frame[1]
 
+    def source(self, n):
+        """ return frame of source <n> (0=A, 1=B, 2=C, ...)
+        """
+        return self.frame[n]
+
+    def sources(self):
+        return len(self.frame)
+
+    def resize(self, sources, size):
+        """ add invisible frames of <size> until there are <sources> sources
+        """
+        while len(self.frame) < sources:
+            f = Frame(True)
+            f.original_size = size
+            self.frame.append(f)
+            self.default.append(None)
+
     def swap(self):
-        """ swap A and B source items
+        """ swap A and B source items (C, D, ... stay where they are)
         """
         if self.noswap:
             return self
         else:
             # then swap frames
-            self.frame = self.frame[::-1]
+            self.frame = self.frame[1::-1] + self.frame[2:]
             self.name = swap_name(self.name)
 
     def swapped(self):
@@ -115,12 +198,33 @@ class Composite:
         if self.noswap:
             return self
         else:
-            # deep copy everything
-            s = copy.deepcopy(self)
+            # copy everything (but frozen frames)
+            s = Composite(self.order, self.name, *self.frame)
+            s.default = list(self.default)
+            s.inter = self.inter
+            s.noswap = self.noswap
             # then swap frames
             s.swap()
             return s
 
+    def projected(self, size):
+        """ return a copy of this composite projected to output <size>
+            (see Frame.projected())
+        """
+        p = Composite(self.order, self.name,
+                      *[f.projected(size) for f in self.frame])
+        p.default = list(self.default)
+        p.inter = self.inter
+        p.noswap = self.noswap
+        return p
+
+    def freeze(self):
+        """ make frames immutable so that this composite can be copied and
+            swapped without copying its frames
+        """
+        self.frame = [f.freeze() for f in self.frame]
+        return self
+
     def key(self):
         for f in self.frame:
             if f.key:
@@ -130,35 +234,45 @@ class Composite:
     def config(self, attr, value, size):
         """ set value <value> from INI attribute <attr>.
             <size> is the input channel size
+            Instead of strings rectangles and croppings may be given as
+            L/T/R/B lists and alpha as a number (floats are proportional).
+            Sources are addressed by letters (a, b, c, ...) and will be added
+            when configured (Composites.configure() raises ValueError if any
+            source before the last one is never configured).
         """
-        if attr == 'a':
-            self.frame[0].rect = str2rect(value, size)
-        elif attr == 'b':
-            self.frame[1].rect = str2rect(value, size)
-        elif attr == 'crop-a':
-            self.frame[0].crop = str2crop(value, size)
-        elif attr == 'crop-b':
-            self.frame[1].crop = str2crop(value, size)
-        elif attr == 'default-a':
-            self.default[0] = value
-        elif attr == 'default-b':
-            self.default[1] = value
-        elif attr == 'alpha-a':
-            self.frame[0].alpha = str2alpha(value)
-        elif attr == 'alpha-b':
-            self.frame[1].alpha = str2alpha(value)
+        # pre-parsed values do not need any string parsing
+        parsed = type(value) is not str
+        # split attribute into property and source letter
+        r = SOURCE_ATTRIBUTE.match(attr)
+        if r:
+            prop, n = r.group(1), SOURCES.index(r.group(2))
+            self.resize(n + 1, size)
+            if prop is None:
+                self.frame[n].rect = parse_rect(value, size)
+                self.frame[n].config = (value, self.frame[n].config[1]
+                                        if self.frame[n].config else None)
+            elif prop == 'crop':
+                self.frame[n].crop = parse_crop(value, size)
+                self.frame[n].config = (self.frame[n].config[0]
+                                        if self.frame[n].config else None,
+                                        value)
+            elif prop == 'default':
+                self.default[n] = value
+            elif prop == 'alpha':
+                self.frame[n].alpha = (num2alpha(value) if parsed
+                                       else str2alpha(value))
         elif attr == 'inter':
             self.inter = value
         elif attr == 'noswap':
             self.noswap = value
-        self.frame[0].original_size = size
-        self.frame[1].original_size = size
+        for f in self.frame:
+            f.original_size = size
 
     def covered(self):
         """ check if below is completely covered by above
             (considers shape with cropping and transparency)
         """
-        below, above = self.frame
+        below, above = self.frame[0], self.frame[1]
         if below.invisible():
             return True
         if above.invisible():
@@ -174,18 +288,16 @@ class Composite:
 
 
 def add_swapped_targets(composites):
+    # signatures of all targets (equal signatures mean equals(..., True))
+    signatures = set(c.signature() for c in composites.values()
+                     if not c.inter)
     result = dict()
     for c_name, c in composites.items():
         if not c.inter:
-            inc = True
-            for v_name, v in composites.items():
-                if v.equals(c.swapped(), True) and not v.inter:
-                    inc = False
-                    break
-            if inc:
+            r = c.swapped()
+            if r.signature() not in signatures:
                 log.debug("adding auto-swapped target %s from %s" %
                           (swap_name(c_name), c_name))
-                r = c.swapped()
                 r.order = len(composites) + len(result)
                 result[swap_name(c_name)] = r
     return composites.update(result)
@@ -208,6 +320,20 @@ def absolute(str, max):
         return int(str)
 
 
+def parse_rect(value, size):
+    """ read rectangle from a configured string or pre-parsed list <value>
+    """
+    return (str2rect(value, size) if type(value) is str
+            else list2rect(value, size))
+
+
+def parse_crop(value, size):
+    """ read crop values from a configured string or pre-parsed list <value>
+    """
+    return (str2crop(value, size) if type(value) is str
+            else list2rect(value, size))
+
+
 def str2rect(str, size):
     """ read rectangle pair from string '*', 'X/Y WxH', 'X/Y', 'WxH', 'X/Y WH', 'X/Y WH' or 'XY WH'
     """
@@ -270,6 +396,18 @@ def str2rect(str, size):
                        "(must be either '*', 'X/Y WxH', 'X/Y', 'WxH', 'X/Y WH', 'X/Y WH' or 'XY WH' where X, Y, W, H may be int or float and XY, WH must be float)".format(str))
 
 
+def list2rect(values, size):
+    """ read rectangle or crop values from a pre-parsed list L/T/R/B
+    """
+    if (type(values) not in [list, tuple] or len(values) != 4 or
+            any(type(v) not in [int, float] for v in values)):
+        raise RuntimeError("syntax error in rectangle or crop value '{}' "
+                           "(must be a list L/T/R/B of int or float)"
+                           .format(values))
+    return [int(v * size[i % 2]) if type(v) is float else v
+            for i, v in enumerate(values)]
+
+
 def str2crop(str, size):
     """ read crop values pair from string '*' or 'L/T/R/B'
     """
@@ -319,3 +457,13 @@ def str2alpha(str):
     # didn't get it
     raise RuntimeError("syntax error in alpha value '{}' "
                        "(must be float or int)".format(str))
+
+
+def num2alpha(value):
+    """ read alpha value from a pre-parsed float between 0.0 and 1.0 or int
+        between 0 and 255
+    """
+    if type(value) not in [int, float]:
+        raise RuntimeError("syntax error in alpha value '{}' "
+                           "(must be float or int)".format(value))
+    return int(value * 255) if type(value) is float else value
@@ -10,12 +10,16 @@ log = logging.getLogger('Frame')
 
 class Frame:
 
+    __slots__ = ('rect', 'crop', 'alpha', 'original_size', 'key', 'config')
+
     def __init__(self, key=False):
         self.rect = [0, 0, 0, 0]
         self.crop = [0, 0, 0, 0]
         self.alpha = 255
         self.original_size = [0.0, 0.0]
         self.key = key
+        # configured rect and crop values (see Composite.config())
+        self.config = None
 
     def __repr__(self):
         z = [round(x, 1) for x in self.zoom]
@@ -26,17 +30,64 @@ class Frame:
 
     def __str__(self):
         return ("(%4d,%4d  %4d,%4d  %4d  %4d,%4d,%4d,%4d  %1.2f,%1.2f)" %
-                tuple(self.rect + [self.alpha] + self.crop + self.zoom()))
+                (tuple(self.rect) + (self.alpha,) + tuple(self.crop) +
+                 tuple(self.zoom())))
 
     def __eq__(self, other):
         # do NOT compare zoom
-        return self.rect == other.rect and self.crop == other.crop and self.alpha == other.alpha
+        return self.signature() == other.signature()
+
+    def __deepcopy__(self, memo):
+        # a frame only holds flat sequences of numbers which can be copied
+        # much faster than by the generic deepcopy()
+        result = Frame(self.key)
+        result.rect = self.rect[:] if self.rect is not None else None
+        result.crop = self.crop[:]
+        result.alpha = self.alpha
+        result.original_size = self.original_size[:]
+        result.config = self.config
+        return result
+
+    def freeze(self):
+        """ return an immutable copy of this frame
+        """
+        return FrozenFrame(self.rect, self.crop, self.alpha,
+                           self.original_size, self.key, self.config)
+
+    def signature(self):
+        """ return a hashable key which is equal for frames which compare
+            equal (see __eq__)
+        """
+        return (tuple(self.rect) if self.rect is not None else None,
+                tuple(self.crop), self.alpha)
+
+    def projected(self, size):
+        """ return a frozen copy of this frame projected from its original size
+            to <size>. Configured values are parsed again for <size> so that
+            the result equals the frame configured at <size>. Any others are
+            scaled where integer coordinates are truncated like configured
+            proportional values are.
+        """
+        scale = [size[X] / self.original_size[X],
+                 size[Y] / self.original_size[Y]] * 2
+        rect = ([int(v * s) if type(v) is int else v * s
+                 for v, s in zip(self.rect, scale)]
+                if self.rect is not None else None)
+        crop = [int(v * s) for v, s in zip(self.crop, scale)]
+        if self.config:
+            # parsers live in composites which imports this module
+            from composites import parse_rect, parse_crop
+            if self.config[0] is not None:
+                rect = parse_rect(self.config[0], size)
+            if self.config[1] is not None:
+                crop = parse_crop(self.config[1], size)
+        return FrozenFrame(rect, crop, self.alpha, size, self.key, self.config)
 
     def zoom(self):
         """ calculate zoom factors from relation between given size and
             width and height of rect in all channels
         """
-        if self.crop != [0, 0, 0, 0]:
+        if any(self.crop):
             return [(self.rect[R] - self.rect[L]) / self.original_size[X], (self.rect[B] - self.rect[T]) / self.original_size[Y]]
         return [0.0, 0.0]
 
@@ -62,3 +113,50 @@ class Frame:
                 self.rect[R] == self.rect[L] or
                 self.rect[T] == self.rect[B] or
                 self.alpha == 0)
+
+
+class FrozenFrame(Frame):
+    """ immutable frame which can be shared between composites without
+        copying (rect and crop are tuples then)
+    """
+
+    __slots__ = ('_signature', '_zoom', '_cropped')
+
+    def __init__(self, rect, crop, alpha, original_size, key=False,
+                 config=None):
+        init = super().__setattr__
+        init('rect', tuple(rect) if rect is not None else None)
+        init('crop', tuple(crop))
+        init('alpha', alpha)
+        init('original_size', tuple(original_size))
+        init('key', key)
+        init('config', config)
+        init('_signature', (self.rect, self.crop, self.alpha))
+        init('_zoom', None)
+        init('_cropped', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("frozen frame can not be changed")
+
+    def __reduce__(self):
+        return (FrozenFrame,
+                (self.rect, self.crop, self.alpha, self.original_size, self.key,
+                 self.config))
+
+    def __copy__(self): return self
+
+    def __deepcopy__(self, memo): return self
+
+    def freeze(self): return self
+
+    def signature(self): return self._signature
+
+    def zoom(self):
+        if self._zoom is None:
+            super().__setattr__('_zoom', tuple(Frame.zoom(self)))
+        return self._zoom
+
+    def cropped(self):
+        if self._cropped is None and self.rect:
+            super().__setattr__('_cropped', tuple(Frame.cropped(self)))
+        return self._cropped
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# for the frame buffer
+import numpy as np
+# for positioning text
+import math
+# for the least recently used cache of rendered text
+from collections import OrderedDict
+# for the PIL backend and drawing text
+from PIL import Image, ImageDraw
+
+# substitute array coordinate mappings fer better reading
+X, Y = 0, 1
+
+# bits of fixed point precision used by PIL's Image.alpha_composite()
+PRECISION_BITS = 7
+
+# offsets of the red, green and blue rows in lookup tables
+CHANNELS = np.arange(3, dtype=np.intp) * 256
+
+# rendered text images of NumPyRaster
+Texts = OrderedDict()
+TEXT_CACHE_SIZE = 1024
+
+
+class PILRaster:
+    """ renders images by drawing every layer into a separate transparent
+        PIL image and stacking them with Image.alpha_composite()
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._image = None
+        self._layer = None
+        self._draw = None
+        # layers kept for reuse (current layer is copied before drawing into
+        # it if it is shared with them)
+        self.kept = dict()
+        self._shared = False
+
+    def clear(self, color):
+        """ start a new image filled with <color>
+        """
+        self._image = Image.new('RGBA', self.size, color)
+        self._layer = None
+
+    def draw(self):
+        """ get the drawing context of the current layer
+        """
+        if self._layer is None:
+            self._layer = Image.new('RGBA', self.size, (0, 0, 0, 0))
+            self._draw = ImageDraw.Draw(self._layer)
+        elif self._shared:
+            self._layer = self._layer.copy()
+            self._draw = ImageDraw.Draw(self._layer)
+        self._shared = False
+        return self._draw
+
+    def rectangle(self, xy, fill=None, outline=None):
+        self.draw().rectangle(xy, fill=fill, outline=outline)
+
+    def line(self, xy, fill=None):
+        self.draw().line(xy, fill=fill)
+
+    def text(self, xy, text, font=None, fill=None):
+        self.draw().text(xy, text, font=font, fill=fill)
+
+    def keep(self, key):
+        """ remember what has been drawn into the current layer so far by
+            <key>
+        """
+        self.kept[key] = self._layer
+        self._shared = True
+
+    def reuse(self, key):
+        """ start the current layer with what has been kept by <key> and
+            return False if there is nothing kept
+        """
+        if key not in self.kept:
+            return False
+        self._layer = self.kept[key]
+        self._shared = True
+        return True
+
+    def composite(self):
+        """ blend the current layer onto the image and start a new layer
+        """
+        if self._layer is not None:
+            self._image = Image.alpha_composite(self._image, self._layer)
+            self._layer = None
+
+    def image(self):
+        """ get the rendered image
+        """
+        return self._image
+
+
+class NumPyRaster:
+    """ renders images into one preallocated NumPy RGBA frame buffer.
+        Layers are drawn as indices into a palette of colors within a
+        second reused buffer. Only the drawn areas are blended in place with
+        the same integer arithmetic PIL uses so that images are
+        pixel-identical to the ones of PILRaster.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = np.zeros((size[Y], size[X], 4), np.uint8)
+        # palette indices of the current layer (0 = transparent)
+        self.layer = np.zeros((size[Y], size[X]), np.uint8)
+        self.palette = [(0, 0, 0, 0)]
+        # RGBA pixels of text in the current layer (pixels are either drawn
+        # into layer or into rgba)
+        self.rgba = None
+        # bounds (left, top, right, bottom) and palette index of all areas
+        # drawn into the current layer (index is None for text areas)
+        self.areas = []
+        self.texts = False
+        # true while all pixels in the frame buffer are opaque
+        self.opaque = False
+        # blend lookup tables of colors over opaque pixels
+        self.luts = dict()
+        # layers kept for reuse
+        self.kept = dict()
+        # for measuring text
+        self.measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+    def clear(self, color):
+        """ start a new image filled with <color>
+        """
+        # fill whole pixels at once
+        self.buffer.view(np.uint32)[:] = \
+            np.array(ink(color), np.uint8).view(np.uint32)
+        self.opaque = ink(color)[3] == 255
+
+    def fill(self, x0, y0, x1, y1, color):
+        """ set all pixels within inclusive bounds to <color>
+        """
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.size[X] - 1), min(y1, self.size[Y] - 1)
+        if x0 > x1 or y0 > y1:
+            return
+        color = ink(color)
+        if color not in self.palette:
+            assert len(self.palette) < 256, "too many colors in layer"
+            self.palette.append(color)
+        index = self.palette.index(color)
+        self.layer[y0:y1 + 1, x0:x1 + 1] = index
+        if self.texts:
+            # overwrite text
+            self.rgba[y0:y1 + 1, x0:x1 + 1] = 0
+        self.areas.append(((x0, y0, x1, y1), index))
+
+    def rectangle(self, xy, fill=None, outline=None):
+        """ draw a rectangle like ImageDraw.rectangle() does
+        """
+        x0, y0, x1, y1 = [int(v) for v in xy]
+        if xy[2] < xy[0]:
+            raise ValueError("x1 must be greater than or equal to x0")
+        if xy[3] < xy[1]:
+            raise ValueError("y1 must be greater than or equal to y0")
+        if fill is not None:
+            self.fill(x0, y0, x1, y1, fill)
+        if outline is not None and (fill is None or ink(outline) != ink(fill)):
+            self.fill(x0, y0, x1, y0, outline)
+            self.fill(x0, y1, x1, y1, outline)
+            # PIL draws the sides from top + 1 to bottom - 1 which reaches
+            # below one pixel high rectangles
+            top, bottom = min(y0 + 1, y1), max(y1 - 1, y0 + 1)
+            self.fill(x0, top, x0, bottom, outline)
+            self.fill(x1, top, x1, bottom, outline)
+
+    def line(self, xy, fill=None):
+        """ draw a line like ImageDraw.line() does
+        """
+        x0, y0, x1, y1 = [int(v) for v in xy]
+        if x0 == x1 or y0 == y1:
+            self.fill(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1),
+                      fill)
+            return
+        # step pixel by pixel along the longer axis and round the other
+        # coordinate like PIL's Bresenham algorithm does
+        swap = abs(y1 - y0) > abs(x1 - x0)
+        if swap:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        dx, dy = abs(x1 - x0), abs(y1 - y0)
+        i = np.arange(dx + 1)
+        x = x0 + np.sign(x1 - x0) * i
+        y = y0 + np.sign(y1 - y0) * ((2 * dy * i + dx) // (2 * dx))
+        # fill every run of pixels in the same row (or column) at once
+        runs = np.flatnonzero(np.diff(y)) + 1
+        for first, last in zip(np.concatenate(([0], runs)),
+                               np.concatenate((runs, [dx + 1])) - 1):
+            a, b = sorted((int(x[first]), int(x[last])))
+            if swap:
+                self.fill(int(y[first]), a, int(y[first]), b, fill)
+            else:
+                self.fill(a, int(y[first]), b, int(y[first]), fill)
+
+    def text(self, xy, text, font=None, fill=None):
+        """ draw text with PIL into the current layer
+        """
+        x, y = xy
+        # rendered text is cached by it's sub-pixel position
+        fx, fy = math.floor(x), math.floor(y)
+        key = (text, font, tuple(fill) if fill else fill, x - fx, y - fy)
+        if key in Texts:
+            Texts.move_to_end(key)
+        else:
+            # render into the area the text covers (with some spare pixels)
+            l, t, r, b = self.measure.textbbox((x - fx, y - fy), text,
+                                               font=font)
+            ox = min(math.floor(l) - 2, 0)
+            oy = min(math.floor(t) - 2, 0)
+            image = Image.new('RGBA', (math.ceil(r) + 3 - ox,
+                                       math.ceil(b) + 3 - oy), (0, 0, 0, 0))
+            ImageDraw.Draw(image).text((x - fx - ox, y - fy - oy), text,
+                                       font=font, fill=fill)
+            Texts[key] = (np.asarray(image), ox, oy)
+            if len(Texts) > TEXT_CACHE_SIZE:
+                Texts.popitem(last=False)
+        pixels, ox, oy = Texts[key]
+        x0, y0 = fx + ox, fy + oy
+        x1, y1 = x0 + pixels.shape[1] - 1, y0 + pixels.shape[0] - 1
+        if self.rgba is None:
+            self.rgba = np.zeros(self.buffer.shape, np.uint8)
+        area = np.s_[max(y0, 0):min(y1, self.size[Y] - 1) + 1,
+                     max(x0, 0):min(x1, self.size[X] - 1) + 1]
+        layer = self.layer[area]
+        if layer.size == 0:
+            return
+        if (x0 >= 0 and y0 >= 0 and layer.shape == pixels.shape[:2] and
+                not layer.any() and not (self.texts and self.rgba[area].any())):
+            # text on nothing looks like the rendered one
+            self.rgba[area] = pixels
+        else:
+            # text is anti-aliased so move drawn colors below into RGBA
+            drawn = layer != 0
+            self.rgba[area][drawn] = \
+                np.array(self.palette, np.uint8)[layer[drawn]]
+            layer[drawn] = 0
+            image = Image.fromarray(self.rgba[area])
+            ImageDraw.Draw(image).text((x - max(x0, 0), y - max(y0, 0)),
+                                       text, font=font, fill=fill)
+            self.rgba[area] = np.asarray(image)
+        self.areas.append(((max(x0, 0), max(y0, 0),
+                            min(x1, self.size[X] - 1),
+                            min(y1, self.size[Y] - 1)), None))
+        self.texts = True
+
+    def keep(self, key):
+        """ remember what has been drawn into the current layer so far by
+            <key>
+        """
+        self.kept[key] = (list(self.palette), self.texts,
+                          [(bounds, index,
+                            (self.layer if index else self.rgba)
+                            [bounds[1]:bounds[3] + 1,
+                             bounds[0]:bounds[2] + 1].copy())
+                           for bounds, index in self.areas])
+
+    def reuse(self, key):
+        """ start the current layer with what has been kept by <key> and
+            return False if there is nothing kept
+        """
+        if key not in self.kept:
+            return False
+        assert not self.areas, "current layer is not empty"
+        palette, self.texts, areas = self.kept[key]
+        self.palette = list(palette)
+        for (x0, y0, x1, y1), index, pixels in areas:
+            (self.layer if index else self.rgba)[y0:y1 + 1, x0:x1 + 1] = pixels
+            self.areas.append(((x0, y0, x1, y1), index))
+        return True
+
+    def lut(self, color):
+        """ get table of channel values resulting from blending <color> over
+            opaque pixels
+        """
+        if color not in self.luts:
+            d = np.arange(256, dtype=np.uint32)
+            coef1 = color[3] << PRECISION_BITS
+            coef2 = (255 << PRECISION_BITS) - coef1
+            lut = np.empty((3, 256), np.uint8)
+            for c in range(3):
+                v = color[c] * coef1 + d * coef2 + (0x80 << PRECISION_BITS)
+                lut[c] = (((v >> 8) + v) >> 8) >> PRECISION_BITS
+            self.luts[color] = lut
+        return self.luts[color]
+
+    def composite(self):
+        """ blend the current layer in place onto the frame buffer and clear
+            the layer
+        """
+        if not self.areas:
+            return
+        # find areas which are partly overwritten by following ones
+        b = np.array([bounds for bounds, index in self.areas])
+        covered = np.triu((b[:, None, 0] <= b[None, :, 2]) &
+                          (b[None, :, 0] <= b[:, None, 2]) &
+                          (b[:, None, 1] <= b[None, :, 3]) &
+                          (b[None, :, 1] <= b[:, None, 3]), 1).any(1)
+        luts = None
+        # begin with the topmost area which no other area overwrites
+        for i in reversed(range(len(self.areas))):
+            (x0, y0, x1, y1), index = self.areas[i]
+            area = np.s_[y0:y1 + 1, x0:x1 + 1]
+            if index is None:
+                # blended pixels become transparent so that overlapping areas
+                # will not blend them again
+                alpha_composite(self.buffer[area], self.rgba[area])
+                self.rgba[area] = 0
+                continue
+            if self.opaque and not covered[i]:
+                # blend one color over the whole area
+                lut = self.lut(self.palette[index])
+                pixels = self.buffer[area].view(np.uint32)
+                if (pixels == pixels[0, 0]).all():
+                    # blend only one pixel if the area is uniform
+                    pixel = self.buffer[y0, x0].copy()
+                    pixel[:3] = lut[range(3), pixel[:3]]
+                    pixels[:] = pixel.view(np.uint32)
+                else:
+                    rgb = self.buffer[area + (slice(3),)]
+                    rgb[:] = lut.take(rgb + CHANNELS)
+            elif self.opaque:
+                # blend every pixel by looking up the table row of it's
+                # palette index (first row keeps pixels already blended)
+                if luts is None:
+                    luts = np.stack([np.broadcast_to(
+                        np.arange(256, dtype=np.uint8), (3, 256))] +
+                        [self.lut(c) for c in self.palette[1:]], 1)
+                    offsets = np.arange(3, dtype=np.intp) * luts[0].size
+                rgb = self.buffer[area + (slice(3),)]
+                rgb[:] = luts.take(offsets + rgb +
+                                   (self.layer[area + (None,)].astype(np.intp) << 8))
+            else:
+                colors = np.array(self.palette, np.uint8)
+                alpha_composite(self.buffer[area], colors[self.layer[area]])
+            self.layer[area] = 0
+        self.palette = [(0, 0, 0, 0)]
+        self.areas = []
+        self.texts = False
+
+    def image(self):
+        """ get a copy of the frame buffer as PIL image
+        """
+        return Image.fromarray(self.buffer.copy())
+
+
+def ink(color):
+    """ convert <color> into an RGBA pixel like PIL does
+    """
+    return tuple(min(max(int(c), 0), 255) for c in color)
+
+
+def alpha_composite(dst, src):
+    """ blend RGBA pixels <src> over <dst> in place like
+        Image.alpha_composite() does
+    """
+    s = src.astype(np.uint32)
+    d = dst.astype(np.uint32)
+    sa = s[..., 3:]
+    a = sa * 255 + d[..., 3:] * (255 - sa)
+    coef1 = sa * (255 * 255 << PRECISION_BITS) // np.maximum(a, 1)
+    coef2 = (255 << PRECISION_BITS) - coef1
+    rgb = s[..., :3] * coef1 + d[..., :3] * coef2 + \
+        (0x80 << PRECISION_BITS)
+    rgb = (((rgb >> 8) + rgb) >> 8) >> PRECISION_BITS
+    a += 0x80
+    a = ((a >> 8) + a) >> 8
+    # transparent pixels leave the destination untouched
+    visible = sa[..., 0] != 0
+    dst[visible, :3] = rgb[visible]
+    dst[visible, 3] = a[visible, 0]
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import composites
+import transitions
+from composites import Composites, Composite
+from transitions import Transitions, Transition
+from frame import Frame
+# for measuring peak memory usage
+import tracemalloc
+# for wrapping measured functions
+import functools
+import inspect
+import time
+
+# measured functions by owning module or class and attribute name with the
+# name of the stage they are reported as (in order of the report)
+STAGES = [(Composites, 'configure', "configure composites"),
+          (Composite, 'config', "parse composite values"),
+          (composites, 'add_swapped_targets', "add swapped targets"),
+          (Composite, 'equals', "equals()"),
+          (Frame, '__deepcopy__', "deep copies"),
+          (Transitions, 'configure', "configure transitions"),
+          (transitions, 'parse_asterisk', "expand wildcards"),
+          (Transitions, 'add', "insert into table"),
+          (Transitions, 'load', "load cache file"),
+          (Transitions, 'save', "save cache file"),
+          (Transitions, 'precalculate', "calculate in parallel"),
+          (Transitions, 'find', "find transitions"),
+          (Transitions, 'calculate', "lazy cache"),
+          (Transition, 'calculate', "calculate transitions"),
+          (Transition, 'parametrize', "parametrize transitions"),
+          (Transition, 'moves', "interpolate frames"),
+          (transitions, 'fit', "fit splines"),
+          (transitions, 'evaluate', "evaluate splines"),
+          (transitions, 'find_nearest', "find nearest points"),
+          (transitions, 'measure', "measure paths"),
+          (transitions, 'distribute', "distribute()"),
+          (transitions, 'morphs', "morph frames"),
+          (transitions, 'pack', "pack frames"),
+          ]
+
+
+class Stats:
+    """ per stage timers and call counters of configuring and calculating
+        composites and transitions.
+        Measuring only takes place between enable() and disable() (or within
+        a with statement) by temporarily replacing the measured functions
+        so that there are no costs at all when disabled.
+    """
+
+    def __init__(self, memory=False):
+        # exclusive seconds spent within every stage
+        self.times = dict()
+        # number of calls of every stage
+        self.calls = dict()
+        # seconds spent to calculate every transition by its id()
+        self.costs = dict()
+        # also trace peak memory usage
+        self.memory = memory
+        self.peak = None
+        # running stages with their start time and time spent in children
+        self.stack = []
+        # original functions while enabled
+        self.originals = None
+        self.depth = 0
+        # transition table measured by Transitions.configure()
+        self.transitions = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def enable(self):
+        """ start measuring (may be nested)
+        """
+        self.depth += 1
+        if self.depth > 1:
+            return
+        self.originals = [(owner, attr, owner.__dict__[attr])
+                          for owner, attr, stage in STAGES]
+        for (owner, attr, stage), (_, _, function) in zip(STAGES,
+                                                           self.originals):
+            setattr(owner, attr, self.wrap(function, stage))
+        if self.memory:
+            tracemalloc.start()
+
+    def disable(self):
+        """ stop measuring and restore all measured functions
+        """
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        for owner, attr, function in self.originals:
+            setattr(owner, attr, function)
+        self.originals = None
+        if self.memory:
+            self.peak = max(self.peak or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    def wrap(self, function, stage):
+        """ return a replacement of <function> which measures <stage>
+        """
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def measured(*args, **kwargs):
+                self.count(stage)
+                generator = function(*args, **kwargs)
+                while True:
+                    # measure the generator while it generates the next item
+                    self.start(stage)
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.stop()
+                    yield item
+        elif stage == "calculate transitions":
+            @functools.wraps(function)
+            def measured(transition, *args, **kwargs):
+                self.count(stage)
+                self.start(stage)
+                try:
+                    return function(transition, *args, **kwargs)
+                finally:
+                    self.costs[id(transition)] = (
+                        self.costs.get(id(transition), 0.0) + self.stop())
+        else:
+            @functools.wraps(function)
+            def measured(*args, **kwargs):
+                self.count(stage)
+                self.start(stage)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.stop()
+        return measured
+
+    def count(self, stage):
+        # do not count a stage again which calls itself
+        if not self.stack or self.stack[-1][0] != stage:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def start(self, stage):
+        self.stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self):
+        """ stop the latest started stage and return its inclusive duration
+        """
+        stage, start, children = self.stack.pop()
+        duration = time.perf_counter() - start
+        self.times[stage] = self.times.get(stage, 0.0) + duration - children
+        if self.stack:
+            self.stack[-1][2] += duration
+        return duration
+
+    def cost(self, transition):
+        """ return the seconds spent to calculate <transition> or None
+        """
+        return self.costs.get(id(transition))
+
+    def __str__(self):
+        """ write a per stage breakdown into a string
+        """
+        total = sum(self.times.values())
+        result = "%-28s %8s %12s %6s\n" % ("stage", "calls", "time", "")
+        for owner, attr, stage in STAGES:
+            if stage in self.calls:
+                result += "%-28s %8d %9.1f ms %5.1f%%\n" % (
+                    stage, self.calls[stage], self.times.get(stage, 0.0) * 1000,
+                    self.times.get(stage, 0.0) / total * 100 if total else 0.0)
+        result += "%-28s %8s %9.1f ms\n" % ("total", "", total * 1000)
+        if self.transitions and self.transitions.pending is not None:
+            result += ("lazy transition cache: %d hit(s), %d miss(es)\n" %
+                       (self.transitions.hits, self.transitions.misses))
+        if self.peak is not None:
+            result += "peak memory usage: %.1f MiB\n" % (self.peak / 2**20)
+        return result
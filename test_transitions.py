@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# run with 'python3 -m pytest'
+import configparser
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import raster
+from composites import Composites
+import transitions
+from transitions import Transitions
+
+# directory of the modules and of composite.ini
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def configuration():
+    """ return the composites and transitions sections of composite.ini
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(HERE, "composite.ini"))
+    return config.items("composites"), config.items("transitions")
+
+
+def table(size, **options):
+    """ return composites, targets and the transition table of composite.ini
+        for <size> configured with <options> (see Transitions.configure())
+    """
+    composites_cfg, transitions_cfg = configuration()
+    composites = Composites.configure(composites_cfg, size)
+    targets = Composites.targets(composites)
+    return composites, targets, Transitions.configure(
+        transitions_cfg, composites, targets, **options)
+
+
+def table_frames(transitions, targets):
+    """ return the values of all frames of all transitions in <transitions>
+        (lazy ones are calculated by find())
+    """
+    result = []
+    for begin in targets:
+        for end in targets:
+            t = transitions.find(begin, end)
+            result.append(t and (t.name(), [
+                [(f.rect and tuple(map(float, f.rect)),
+                  tuple(map(float, f.crop)), float(f.alpha), f.key)
+                 for f in c.frame] for c in t.composites]))
+    return result
+
+
+def run_testtransition(directory, *args):
+    """ run testtransition.py with <args> in <directory> (which gets a copy
+        of composite.ini) and return everything it printed
+    """
+    shutil.copy(os.path.join(HERE, "composite.ini"), directory)
+    process = subprocess.run(
+        [sys.executable, os.path.join(HERE, "testtransition.py")] +
+        list(args), cwd=directory, capture_output=True, text=True,
+        check=True)
+    return process.stdout + process.stderr
+
+
+def rendered_frames(output):
+    """ return the numbers of frames of all rendered transitions in <output>
+        of testtransition.py (needs -vv)
+    """
+    return [int(n) for n in re.findall(r"rendered (\d+) frames", output)]
+
+
+def test_parallel_rendering_of_lazy_table(tmp_path):
+    # workers must get every transition calculated even if the least
+    # recently used cache has already reset it
+    args = ["-g", "-P", "-n", "-z", "30", "-vv"]
+    serial = rendered_frames(run_testtransition(tmp_path, "-j", "1", *args))
+    parallel = rendered_frames(run_testtransition(tmp_path, "-j", "2", *args))
+    assert serial and all(n > 3 for n in serial)
+    assert parallel == serial
+
+
+def test_splines_equal_scipy():
+    # the default NumPy splines must be bit identical to SciPy's ones
+    pytest.importorskip("scipy")
+    rng = np.random.default_rng(0)
+    u = np.linspace(0.0, 1.0, 101)
+    for n in range(300):
+        points = rng.integers(-2000, 2000, (rng.integers(3, 8), 2)) * 1.0
+        tck = transitions.fit(points)
+        expected = transitions.fit(points, scipy=True)
+        assert np.array_equal(tck[0], expected[0])
+        assert np.array_equal(tck[1], expected[1])
+        assert np.array_equal(transitions.evaluate(tck, points, u),
+                              transitions.evaluate(expected, points, u,
+                                                   scipy=True))
+
+
+def test_lines_equal_pil():
+    # NumPyRaster must draw lines in any direction pixel by pixel like PIL
+    rng = np.random.default_rng(0)
+    size = (40, 30)
+    rasters = [raster.PILRaster(size), raster.NumPyRaster(size)]
+    for n in range(50):
+        lines = rng.integers(-10, 50, (8, 4)).tolist()
+        colors = rng.integers(0, 256, (8, 4)).tolist()
+        for r in rasters:
+            r.clear((32, 32, 32, 255))
+            for xy, color in zip(lines, colors):
+                r.line(xy, fill=tuple(color))
+            r.composite()
+        assert rasters[0].image().tobytes() == rasters[1].image().tobytes()
+
+
+def test_undeclared_source_letter():
+    # a mistyped source letter must not silently add sources
+    config = {"pip": {"a": "*", "b": "0.5/0.5 0.4", "c": "0/0 0.2"},
+              "fs": {"a": "*", "x": "*"}}
+    with pytest.raises(ValueError, match="source X .* D, E"):
+        Composites.load(config, (1920, 1080))
+    del config["fs"]["x"]
+    assert Composites.load(config, (1920, 1080))["fs"].sources() == 3
+
+
+def test_tables_equal_eager_one():
+    # every way to get a transition table must give the same frames
+    size = [240, 135]
+    composites, targets, eager = table(size)
+    expected = table_frames(eager, targets)
+    assert sum(t is not None for t in expected) > 1
+    assert table_frames(table(size, lazy=True)[2], targets) == expected
+    # such a small cache has to recalculate evicted transitions when they
+    # are found again
+    lazy = table(size, lazy=True, cache_size=30)[2]
+    assert table_frames(lazy, targets) == expected
+    assert table_frames(lazy, targets) == expected
+    assert lazy.misses > len(expected)
+    assert table_frames(table(size, jobs=2)[2], targets) == expected
+
+
+def test_cached_table_equals_eager_one(tmp_path):
+    size = [240, 135]
+    composites, targets, eager = table(size)
+    filename = str(tmp_path / "transitions.cache")
+    eager.save(filename, "key")
+    assert Transitions.load(filename, "other key", targets) is None
+    loaded = Transitions.load(filename, "key", targets)
+    assert table_frames(loaded, targets) == table_frames(eager, targets)
+
+
+# MD5 of the transitions calculated by the original implementation (before
+# lazy tables, NumPy splines, path interpolation, ...) in full precision
+BASELINE = {(240, 135): "8c43c8338ce660edcca122cce9e90f0a",
+            (1920, 1080): "52d13797b2eec8087649cfcf0f12c322"}
+
+
+def test_default_output_equals_baseline():
+    for size, md5 in BASELINE.items():
+        composites, targets, transitions = table(list(size))
+        out = [str(transitions)]
+        for begin in targets:
+            for end in targets:
+                t = transitions.find(begin, end)
+                if t is None:
+                    out.append("None")
+                    continue
+                out.append(t.name() + " flip=%s" % t.flip())
+                for c in t.composites:
+                    a, b = c.frame[0], c.frame[1]
+                    out.append(repr((c.name,
+                                     [float(x) for x in a.rect],
+                                     [float(x) for x in a.crop],
+                                     float(a.alpha),
+                                     [float(x) for x in b.rect],
+                                     [float(x) for x in b.crop],
+                                     float(b.alpha), bool(a.key))))
+        assert hashlib.md5("\n".join(out).encode()).hexdigest() == md5, size
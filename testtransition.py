@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
 from configparser import SafeConfigParser
-from transitions import Composites, Transitions, L, T, R, B, X, Y
-from PIL import Image, ImageDraw, ImageFont
+from transitions import Composites, Transitions, L, T, R, B, X, Y, cache_key
+from composites import SOURCES
+from PIL import ImageFont
+from raster import PILRaster, NumPyRaster
+from stats import Stats
 # for integer maximum size
 import sys
-# for calling convert to generate animated GIF
-from subprocess import call
-import copy
+# for rendering transitions in parallel
+from concurrent.futures import ProcessPoolExecutor
+import logging.handlers
+# for measuring rendering speed
+import time
 import logging
 import argparse
 
+# available render backends
+Rasters = {'pil': PILRaster, 'numpy': NumPyRaster}
+# fonts and text sizes by size
+Fonts = dict()
+TextSizes = dict()
+# file name extensions of animation formats
+Extensions = {'gif': 'gif', 'apng': 'png'}
+# colors of sources A, B, C, ... (repeated for even more sources)
+Colors = [(128, 0, 0), (0, 0, 128), (0, 128, 0), (128, 128, 0),
+          (0, 128, 128), (128, 0, 128)]
+
+# per stage measurements when profiling
+Profile = None
+
 
 def read_arguments():
     global Args
@@ -40,15 +59,34 @@ def read_arguments():
     parser.add_argument('-P', '--nopng', action='count',
                         help="when using -g: do not write PNG files (forces -G)")
     parser.add_argument('-L', '--leave', action='count',
-                        help="when using -g: do not delete temporary PNG files")
+                        help="when using -g: also save every animation frame into a PNG file")
     parser.add_argument('-G', '--nogif', action='count',
-                        help="when using -g: do not generate animated GIFS")
+                        help="when using -g: do not generate animation files")
+    parser.add_argument('-f', '--format', choices=sorted(Extensions), default='gif',
+                        help="when using -g: file format of generated animations")
+    parser.add_argument('-x', '--cache', metavar='FILE',
+                        help="load transition table from cache file (rebuild it if outdated)")
+    parser.add_argument('-z', '--lazy', metavar='FRAMES', type=int, nargs='?', const=0,
+                        help="calculate transitions on demand and keep at most FRAMES frames calculated (unlimited if not given)")
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help="calculate and render transitions with N parallel processes (0 = one per CPU)")
+    parser.add_argument('-p', '--precision', metavar='PX', type=float,
+                        help="sample interpolation paths with a precision of PX pixels instead of a fixed resolution")
+    parser.add_argument('-s', '--size', metavar='WxH',
+                        help="project calculated transitions to an output size of WxH pixels instead of the configured one")
+    parser.add_argument('-b', '--backend', choices=sorted(Rasters), default='pil',
+                        help="render images with PIL layers or into a NumPy frame buffer")
+    parser.add_argument('--profile', action='count', default=0,
+                        help="print time spent per stage and calculation costs within the transition table (twice: also trace peak memory usage)")
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help="also print WARNING (-v), INFO (-vv) and DEBUG (-vvv) messages")
     Args = parser.parse_args()
     # implicit options
     if Args.nopng:
         Args.nogif = 1
+        Args.leave = None
+    if Args.size and Args.lazy is not None:
+        parser.error("-s/--size can not be used with -z/--lazy")
 
 
 def init_log():
@@ -62,7 +100,11 @@ def init_log():
 
 
 def read_config(filename):
-    global log, Args
+    global log, Args, Profile
+    # measure everything from here on if wanted
+    if Args.profile:
+        Profile = Stats(Args.profile > 1)
+        Profile.enable()
     # load INI files
     config = SafeConfigParser()
     config.read(filename)
@@ -90,13 +132,37 @@ def read_config(filename):
               (len(targets), '\n\t'.join([t.name for t in targets])))
         print("%d intermediate composite(s):\n\t%s\t" %
               (len(intermediates), '\n\t'.join([t.name for t in intermediates])))
-    # read transitions from configuration
-    log.info("reading transitions from configuration...")
-    transitions = Transitions.configure(
-        config.items('transitions'), composites, targets, fps)
+    transitions = None
+    if Args.cache:
+        # calculate key of the transition table cache
+        key = cache_key(config.items('composites'),
+                        config.items('transitions'), size, fps, Args.precision)
+        # try to load transitions from cache file
+        log.info("loading transitions from cache '%s'..." % Args.cache)
+        transitions = Transitions.load(Args.cache, key, targets)
+    if not transitions:
+        # read transitions from configuration
+        log.info("reading transitions from configuration...")
+        # calculate in this process when profiling to get the costs of
+        # every transition
+        transitions = Transitions.configure(
+            config.items('transitions'), composites, targets, fps,
+            Args.lazy is not None, Args.lazy or None,
+            1 if Args.profile else Args.jobs or None, Args.precision,
+            stats=Profile)
+        if Args.cache:
+            log.info("saving transitions into cache '%s'..." % Args.cache)
+            transitions.save(Args.cache, key)
     log.info("read %d transition(s)" % transitions.count())
+    # maybe project transitions to another output size
+    if Args.size:
+        size = [int(v) for v in Args.size.split('x')]
+        log.info("projecting transitions to %dx%d..." % tuple(size))
+        composites = {name: c.projected(size)
+                      for name, c in composites.items()}
+        transitions = transitions.project(size)
     if Args.map:
-        print("transition table:\n%s" % transitions)
+        print("transition table:\n%s" % transitions.map(Profile))
     # maybe overwirte targets by arguments
     if Args.composite:
         # check for composites in arguments
@@ -111,18 +177,40 @@ def read_config(filename):
     return size, fps, sequence, transitions, composites
 
 
-def draw_text(draw, size, line_or_pos, text, fill=(255, 255, 255, 255), align=0):
+def get_font(size):
+    """ get font for drawing text into images of <size> (cached)
+    """
+    points = 11 if size[X] < 400 else (13 if size[X] < 800 else 20)
+    if points not in Fonts:
+        try:
+            Fonts[points] = ImageFont.truetype("FreeSans.ttf", points)
+        except OSError:
+            log.warning("font 'FreeSans.ttf' not found, using default font")
+            Fonts[points] = ImageFont.load_default(points)
+    return Fonts[points]
+
+
+def text_size(text, font):
+    """ measure <text> drawn with <font> (cached)
+    """
+    key = (text, font)
+    if key not in TextSizes:
+        if hasattr(font, 'getsize'):
+            TextSizes[key] = font.getsize(text)
+        else:
+            TextSizes[key] = font.getbbox(text)[2:]
+    return TextSizes[key]
+
+
+def draw_text(raster, size, line_or_pos, text, fill=(255, 255, 255, 255), align=0):
     # get a font
-    font = ImageFont.truetype("FreeSans.ttf",
-                              11 if size[X] < 400 else
-                              (13 if size[X] < 800 else
-                               20))
+    font = get_font(size)
     if type(line_or_pos) == int:
         assert not align
         line_factor = 1.3
-        line_height = font.getsize("|")[Y] * line_factor
+        line_height = text_size("|", font)[Y] * line_factor
         # measure text size
-        x = (size[X] - draw.textsize(text, font=font)[X]) / 2
+        x = (size[X] - text_size(text, font)[X]) / 2
         if line_or_pos >= 0:
             y = line_height * (line_or_pos - 1) + line_height * \
                 (line_factor - 1.0)
@@ -132,113 +220,112 @@ def draw_text(draw, size, line_or_pos, text, fill=(255, 255, 255, 255), align=0)
         assert type(line_or_pos) == list
         x, y = line_or_pos
         if align == 0:
-            x = (x - draw.textsize(text, font=font)[X]) / 2
+            x = (x - text_size(text, font)[X]) / 2
         elif align == -1:
-            x = x - draw.textsize(text, font=font)[X]
-            y = y - draw.textsize(text, font=font)[Y]
-    draw.text([x, y], text, font=font, fill=fill)
-
-
-def draw_composite(size, composite, swap=False):
-    # indices in size and tsize
-    X, Y = 0, 1
-    # create an image to draw into
-    imageBg = Image.new('RGBA', size, (40, 40, 40, 255))
-    imageA = Image.new('RGBA', size, (0, 0, 0, 0))
-    imageB = Image.new('RGBA', size, (0, 0, 0, 0))
-    imageFg = Image.new('RGBA', size, (0, 0, 0, 0))
-    # create a drawing context
-    drawBg = ImageDraw.Draw(imageBg)
-    drawA = ImageDraw.Draw(imageA)
-    drawB = ImageDraw.Draw(imageB)
-    drawFg = ImageDraw.Draw(imageFg)
-    if Args.cross:
-        # mark center lines
-        drawFg.line((size[X] / 2, 0, size[X] / 2, size[Y]),
-                    fill=(0, 0, 0, 128))
-        drawFg.line((0, size[Y] / 2, size[X], size[Y] / 2),
-                    fill=(0, 0, 0, 128))
+            x = x - text_size(text, font)[X]
+            y = y - text_size(text, font)[Y]
+    raster.text([x, y], text, font=font, fill=fill)
+
+
+def draw_composite(raster, size, composite, swap=False):
+    # start with background color
+    raster.clear((40, 40, 40, 255))
 
     # simulate swapping sources
-    a, b = composite.A(), composite.B()
+    frames = composite.frame
     if swap:
-        a, b = b, a
-        if Args.title:
-            draw_text(drawFg, size, 2, "(swapped sources)")
+        frames = frames[1::-1] + frames[2:]
 
-    if Args.crop:
-        # draw source frame
-        drawA.rectangle(a.rect, outline=(128, 0, 0, a.alpha))
-        drawB.rectangle(b.rect, outline=(0, 0, 128, b.alpha))
-    # draw cropped source frame
-    drawA.rectangle(a.cropped(), fill=(128, 0, 0, a.alpha))
-    drawB.rectangle(b.cropped(), fill=(0, 0, 128, b.alpha))
+    # draw frames of all sources into separate layers
+    for i, f in enumerate(frames):
+        color = Colors[i % len(Colors)] + (f.alpha,)
+        if Args.crop:
+            # draw source frame
+            raster.rectangle(f.rect, outline=color)
+        # draw cropped source frame
+        raster.rectangle(f.cropped(), fill=color)
+        raster.composite()
 
-    # silly way to draw on RGBA frame buffer, hey - it's python
-    return Image.alpha_composite(
-        Image.alpha_composite(
-            Image.alpha_composite(imageBg, imageA), imageB), imageFg)
+    # foreground is the same in every image
+    if not raster.reuse(('foreground', swap)):
+        if Args.cross:
+            # mark center lines
+            raster.line((size[X] / 2, 0, size[X] / 2, size[Y]),
+                        fill=(0, 0, 0, 128))
+            raster.line((0, size[Y] / 2, size[X], size[Y] / 2),
+                        fill=(0, 0, 0, 128))
+        if swap and Args.title:
+            draw_text(raster, size, 2, "(swapped sources)")
+        raster.keep(('foreground', swap))
+    raster.composite()
 
 
 def draw_transition(size, transition, info=None):
     # get where to flip sources
     flip_at = transition.flip()
-    # animation as a list of images
-    images = []
-    # render all frames
-    for i in range(transition.frames()):
-        # create an image to draw into
-        imageBg = draw_composite(size, transition.composites[i],
-                                 flip_at is not None and i >= flip_at)
-        imageDesc = Image.new('RGBA', size, (0, 0, 0, 0))
-        imageFg = Image.new('RGBA', size, (0, 0, 0, 0))
-        # create a drawing context
-        drawBg = ImageDraw.Draw(imageBg)
-        drawDesc = ImageDraw.Draw(imageDesc)
-        drawFg = ImageDraw.Draw(imageFg)
-
-        acolor = (256, 128, 128, 128)
-        bcolor = (128, 128, 256, 128)
-
-        if Args.keys:
+    # reuse one raster for all frames
+    raster = Rasters[Args.backend](size)
+    # measure rendering speed
+    duration = 0.0
+    # render all frames one by one
+    for i, composite in enumerate(transition.iter_frames()):
+        start = time.perf_counter()
+        draw_composite(raster, size, composite,
+                       flip_at is not None and i >= flip_at)
+
+        # lighter colors of all sources
+        colors = [tuple(v + 128 for v in Colors[s % len(Colors)]) + (128,)
+                  for s in range(composite.sources())]
+
+        # continue descriptions of the previous frame
+        if not raster.reuse('descriptions') and Args.keys:
             n = 0
             for key in transition.keys():
-                ac = key.A().rect
-                bc = key.B().rect
-                drawDesc.rectangle(ac, outline=acolor)
-                draw_text(drawDesc, size,
-                          [ac[L] + 2, ac[T] + 2],
-                          "A.%d" % n, acolor, 1)
-                drawDesc.rectangle(bc, outline=bcolor)
-                draw_text(drawDesc, size,
-                          [bc[R] - 2, bc[B] - 2],
-                          "B.%d" % n, bcolor, -1)
+                for s, color in enumerate(colors):
+                    r = key.source(s).rect
+                    raster.rectangle(r, outline=color)
+                    if s == 0:
+                        # label A at its top left corner
+                        draw_text(raster, size,
+                                  [r[L] + 2, r[T] + 2],
+                                  "A.%d" % n, color, 1)
+                    else:
+                        # label others at their bottom right corner
+                        draw_text(raster, size,
+                                  [r[R] - 2, r[B] - 2],
+                                  "%s.%d" % (SOURCES[s].upper(), n), color,
+                                  -1)
                 n += 1
 
         if Args.corners:
-            # draw calculated corner points
-            for n in range(0, i + 1):
-                ar = transition.A(n).rect
-                br = transition.B(n).rect
-                drawDesc.rectangle(
-                    (ar[R] - 2, ar[T] - 2, ar[R] + 2, ar[T] + 2), fill=acolor)
-                drawDesc.rectangle(
-                    (br[L] - 2, br[T] - 2, br[L] + 2, br[T] + 2), fill=bcolor)
+            # add calculated corner point of the current frame to the ones
+            # of all previous frames (A moves along its top right corner and
+            # the others along their top left corner)
+            for s, color in enumerate(colors):
+                r = transition.source(s, i).rect
+                x = r[R] if s == 0 else r[L]
+                raster.rectangle(
+                    (x - 2, r[T] - 2, x + 2, r[T] + 2), fill=color)
+        raster.keep('descriptions')
+        raster.composite()
 
         if Args.title:
-            draw_text(drawFg, size, -3, transition.name())
-            if not info is None:
-                draw_text(drawFg, size,  -2, info)
-            draw_text(
-                drawFg, size, -1, " → ".join([c.name for c in transition.keys()]))
-            draw_text(drawFg, size, 1, "Frame %d" % i)
-        # silly way to draw on RGBA frame buffer, hey - it's python
-        images.append(
-            Image.alpha_composite(
-                Image.alpha_composite(imageBg, imageDesc), imageFg)
-        )
-    # return resulting animation images
-    return images
+            # titles are the same in every frame except the frame number
+            if not raster.reuse('titles'):
+                draw_text(raster, size, -3, transition.name())
+                if not info is None:
+                    draw_text(raster, size,  -2, info)
+                draw_text(
+                    raster, size, -1, " → ".join([c.name for c in transition.keys()]))
+                raster.keep('titles')
+            draw_text(raster, size, 1, "Frame %d" % i)
+        raster.composite()
+        image = raster.image()
+        duration += time.perf_counter() - start
+        yield image
+    log.info("rendered %d frames at %dx%d with %s in %.1f ms (%.1f fps)" %
+             (i + 1, size[X], size[Y], Args.backend, duration * 1000,
+              (i + 1) / duration))
 
 
 def save_transition_gif(filename, size, info, transition, time):
@@ -247,38 +334,71 @@ def save_transition_gif(filename, size, info, transition, time):
     log.info("generating transition '%s' (%d ms, %d frames)..." %
              (transition.name(), int(time), frames))
     images = draw_transition(size, transition, info)
-    if not Args.nopng:
-        imagenames = []
+    if Args.leave:
+        log.info("saving animation frames into files '%s0000.png'..'%s%04d.png'..." %
+                 (filename, filename, frames - 1))
+        images = save_frames(filename, images)
+    if Args.nogif:
+        # just render all frames
+        for image in images:
+            pass
+    else:
         delay = int(time / 10.0 / frames)
-        log.info("saving animation frames into temporary files '%s0000.png'..'%s%04d.png'..." %
-                 (filename, filename, transition.frames() - 1))
-        for i in range(0, len(images)):
-            imagenames.append("%s%04d.png" % (filename, i))
-            # save an image
-            images[i].save(imagenames[-1])
-        # generate animated GIF by calling system command 'convert'
-        if not Args.nogif:
-            log.info("creating animated file '%s.gif' with delay %d..." %
-                     (filename, delay))
-            call(["convert", "-loop", "0"] +
-                 ["-delay", "100"] + imagenames[:1] +
-                 ["-delay", "%d" % delay] + imagenames[1:-1] +
-                 ["-delay", "100"] + imagenames[-1:] +
-                 ["%s.gif" % filename])
-        # delete temporary files?
-        if not Args.leave:
-            log.info("deleting temporary PNG files...")
-            call(["rm"] + imagenames)
+        ext = Extensions[Args.format]
+        log.info("creating animated file '%s.%s' with delay %d..." %
+                 (filename, ext, delay))
+        # hold first and last frame for one second
+        durations = [1000] + [delay * 10] * (frames - 2) + [1000]
+        # PIL collects all images of an animation before it writes the file
+        # (for GIF and APNG), so memory grows with the number of frames
+        # (use -L -G to keep just one frame at a time)
+        first = next(images)
+        first.save("%s.%s" % (filename, ext), save_all=True,
+                   append_images=list(images),
+                   duration=durations[-frames:], loop=0)
+
+
+def save_frames(filename, images):
+    """ save every image into a PNG file as soon as it is rendered
+    """
+    for i, image in enumerate(images):
+        image.save("%s%04d.png" % (filename, i))
+        yield image
+
+
+def init_worker(args):
+    """ set up a process for rendering transitions which collects it's log
+        records instead of printing them
+    """
+    global Args, log
+    Args = args
+    init_log()
+    logging.root.handlers = [logging.handlers.BufferingHandler(sys.maxsize)]
+
+
+def render_transition(*args):
+    """ render one transition within a worker process and return the log
+        records it produced
+    """
+    save_transition_gif(*args)
+    records = logging.root.handlers[0].buffer
+    logging.root.handlers[0].buffer = []
+    for record in records:
+        # make records picklable
+        record.msg, record.args = record.getMessage(), None
+    return records
 
 
 def render_composites(size, composites):
     global log
     log.debug("rendering composites (%d items):\n\t%s\t" %
               (len(composites), '\n\t'.join([c.name for c in composites])))
+    raster = Rasters[Args.backend](size)
     for c in composites:
         if Args.generate:
             print("saving composite file '%s.png' (%s)..." % (c.name, c.name))
-            draw_composite(size, c).save("%s.png" % c.name)
+            draw_composite(raster, size, c)
+            raster.image().save("%s.png" % c.name)
 
 
 def render_sequence(size, fps, sequence, transitions, composites):
@@ -291,6 +411,14 @@ def render_sequence(size, fps, sequence, transitions, composites):
     # cound findings
     not_found = []
     found = []
+    # maybe render transitions in parallel
+    renders = []
+    futures = []
+    executor = None
+    if Args.generate and Args.jobs != 1:
+        executor = ProcessPoolExecutor(Args.jobs or None,
+                                       initializer=init_worker,
+                                       initargs=(Args,))
     # process sequence through all possible transitions
     for c_name in sequence[1:]:
         # fetch prev composite
@@ -316,13 +444,33 @@ def render_sequence(size, fps, sequence, transitions, composites):
             if Args.generate:
                 filename = ("%03d" % len(
                     found)) if Args.number else "%s_%s" % (prev_name, c_name)
-                print("saving transition animation file '%s.gif' (%s, %d frames)..." %
-                      (filename, transition.name(), frames))
-                # generate test images for transtion and save into animated GIF
-                save_transition_gif(filename, size, "%s → %s" % (prev_name, c_name),
-                                    transition, frames / fps * 1000.0)
+                renders.append((
+                    "saving transition animation file '%s.%s' (%s, %d frames)..." %
+                    (filename, Extensions[Args.format],
+                     transition.name(), frames),
+                    (filename, size, "%s → %s" % (prev_name, c_name),
+                     transition, frames / fps * 1000.0)))
+                if not executor:
+                    print(renders[-1][0])
+                    # generate test images for transtion and save into animated GIF
+                    save_transition_gif(*renders[-1][1])
+                else:
+                    # workers get the transition when they start to render
+                    # it, so hand over the calculated composites before a
+                    # lazy table resets them
+                    args = renders[-1][1]
+                    futures.append(executor.submit(
+                        render_transition,
+                        *args[:3], args[3].copied(), *args[4:]))
         # remember current transition as next previous
         prev_name, prev = c_name, c
+    if executor:
+        # report rendered transitions in order of the sequence
+        for (message, _), future in zip(renders, futures):
+            print(message)
+            for record in future.result():
+                logging.getLogger(record.name).handle(record)
+        executor.shutdown()
     # report findings
     if found:
         if Args.list:
@@ -331,9 +479,16 @@ def render_sequence(size, fps, sequence, transitions, composites):
     if not_found:
         print("%d transition(s) could NOT be found:\n\t%s" %
               (len(not_found), "\n\t".join(sorted(not_found))))
+    if transitions.pending is not None:
+        log.info("lazy transition cache: %d hit(s), %d miss(es), %d frame(s) kept" %
+                 (transitions.hits, transitions.misses, transitions.cached_frames))
+    if Profile:
+        Profile.disable()
+        print("profile:\n%s" % Profile)
 
-read_arguments()
-init_log()
-cfg = read_config("composite.ini")
-render_composites(cfg[0], Composites.targets(cfg[4]))
-render_sequence(*cfg)
+if __name__ == "__main__":
+    read_arguments()
+    init_log()
+    cfg = read_config("composite.ini")
+    render_composites(cfg[0], Composites.targets(cfg[4]))
+    render_sequence(*cfg)
@@ -1,19 +1,36 @@
 #!/usr/bin/env python3
 # for debug logging
 import logging
-from composites import Composite, Composites, swap_name
-from frame import Frame, L, R, T, B, X, Y
-# for calculating square roots
-import math
-# for generating B-Splines
-from scipy import interpolate as spi
+from composites import Composite, Composites, swap_name, SOURCES
+from frame import Frame, FrozenFrame, L, R, T, B, X, Y
 # for converting arrays
 import numpy as np
-# for cloning objects
-import copy
+# for solving splines like FITPACK does
+import math
+# for expanding wildcards within transition sequences
+import itertools
+# for the least recently used cache of lazy calculated transitions
+from collections import OrderedDict
+# for the default clock of TransitionPlayer
+import time
+# for reading and writing transition table cache files
+import hashlib
+import json
+import os
+import zlib
 
 V = 2  # distance (velocity) index
 
+# identification of transition table cache files
+CACHE_MAGIC = b"VOCTOMIX"
+# increase whenever calculation or cache file layout changes
+CACHE_VERSION = 5
+# values stored per frame within a cache file
+CACHE_VALUES = 9  # L, T, R, B, crop L, crop T, crop R, crop B, alpha
+
+# easing curve of transitions which do not configure one (see EASINGS)
+DEFAULT_EASING = "cosine"
+
 log = logging.getLogger('Transitions')
 
 
@@ -21,13 +38,52 @@ class Transitions:
     """ transition table and interface
     """
 
-    def __init__(self, targets):
+    def __init__(self, targets, lazy=False, cache_size=None, precision=None,
+                 parametric=False):
         self.transitions = [[None] * len(targets) for n in targets]
         self.targets = targets
+        # map visual signatures to the indices of all matching targets
+        self.index = dict()
+        for i in range(len(targets)):
+            self.index.setdefault(targets[i].signature(), []).append(i)
+        # when lazy remember not yet calculated transitions and frame counts
+        self.pending = dict() if lazy else None
+        # least recently used calculated transitions (when lazy)
+        self.cache = OrderedDict()
+        # maximum number of frames to keep calculated (None = unlimited)
+        self.cache_size = cache_size
+        # path sampling precision in pixels (see bspline())
+        self.precision = precision
+        # parametrize transitions instead of calculating frames
+        self.parametric = parametric
+        self.cached_frames = 0
+        self.hits = 0
+        self.misses = 0
+        # number of unique and of skipped sequences while configure()
+        self.kept = 0
+        self.skipped = 0
+        # measurements of configure() (see Stats)
+        self.stats = None
 
     def __str__(self):
         """ write transition table into a string
         """
+        return self.map()
+
+    def map(self, stats=None):
+        """ write transition table into a string and add the calculation
+            costs measured by <stats> (see Stats) behind every transition
+            if given
+        """
+        def cell(t):
+            name = t.name() if t else "-"
+            if not stats:
+                return name
+            cost = stats.cost(t) if t else None
+            return "%s %*s" % (name, tw - len(name) - 1,
+                               "%.1fms" % (cost * 1000) if cost is not None
+                               else "-")
+
         # measure column width for first column
         cw = 1
         for t in self.targets:
@@ -37,6 +93,9 @@ class Transitions:
         for tt in self.transitions:
             for t in tt:
                 tw = max(tw, len(t.name()))
+        if stats:
+            # leave room for the costs
+            tw += 10
         # write transition table header into a string
         result = "%s\n\n" % "".join([("%" + str(cw) + "s  ") % ""] +
                                     [("%-" + str(tw) + "s ") % t.name
@@ -45,38 +104,106 @@ class Transitions:
         # write transition table into a string
         for i in range(len(self.transitions)):
             result += "%s\n" % "".join([("%" + str(cw) + "s  ") % self.targets[i].name] +
-                                       [("%-" + str(tw) + "s ") % (x.name() if x else "-")
+                                       [("%-" + str(tw) + "s ") % cell(x)
                                         for x in self.transitions[i]])
         return result
 
     def find(self, begin, end):
         """ search for a transition in the transition table
         """
-        for b in range(len(self.targets)):
-            for e in range(len(self.targets)):
-                if self.targets[b].equals(begin, True) and self.targets[e].equals(end, True):
-                    return self.transitions[b][e]
+        transition = self.lookup(begin, end)
+        if transition and self.pending is not None:
+            # calculate lazy transition if necessary
+            self.calculate(transition)
+        return transition
+
+    def lookup(self, begin, end):
+        """ return what is stored in the transition table for <begin> and
+            <end> without calculating anything
+        """
+        b = self.index.get(begin.signature())
+        e = self.index.get(end.signature())
+        if b and e:
+            return self.transitions[b[0]][e[0]]
         return None
 
+    def calculate(self, transition):
+        """ make sure a lazy <transition> is calculated and keep it within
+            the least recently used cache
+        """
+        if id(transition) in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(id(transition))
+            return
+        self.misses += 1
+        transition.calculate(self.pending[id(transition)][1],
+                             precision=self.precision)
+        self.cache[id(transition)] = transition
+        self.cached_frames += transition.frames()
+        # drop least recently used transitions until we are within bounds
+        while (self.cache_size is not None and len(self.cache) > 1
+               and self.cached_frames > self.cache_size):
+            key, evicted = self.cache.popitem(last=False)
+            self.cached_frames -= evicted.frames()
+            # keep key composites to recalculate when needed again
+            evicted.composites = evicted.keys()
+
+    def precalculate(self, jobs=None):
+        """ calculate all pending lazy transitions at once by using a pool
+            of <jobs> processes (as many as CPUs available if None) and
+            turn the table into a non lazy one
+        """
+        pending = list(self.pending.values())
+        if pending:
+            # import multiprocessing only if really needed
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(jobs) as pool:
+                # results are delivered in order of the pending transitions
+                results = pool.map(calculated, [t for t, f in pending],
+                                   [f for t, f in pending],
+                                   [self.precision] * len(pending))
+                for (transition, frames), composites in zip(pending, results):
+                    transition.composites = composites
+        self.pending = None
+
     def add(self, transition, frames, overwrite=False):
         """ calculate and add a transition into the transition table
+            (in lazy mode calculation is deferred until find())
         """
         # check if we already added a equivalent transition
-        calculated = self.find(transition.begin(), transition.end())
-        for begin in range(len(self.targets)):
-            for end in range(len(self.targets)):
-                # check if transition matches that place within the table
-                if (self.targets[begin].equals(transition.begin(), True)
-                        and self.targets[end].equals(transition.end(), True)):
-                    # check if place is empty
-                    if overwrite or not self.transitions[begin][end]:
-                        log.debug("adding transition %s = %s -> %s\n%s" %
-                                  (transition.name(), self.targets[begin].name, self.targets[end].name, transition))
-                        # calculate transition if necessary
-                        if not calculated:
-                            transition.calculate(frames)
-                        # add transition to table
-                        self.transitions[begin][end] = transition
+        calculated = self.lookup(transition.begin(), transition.end())
+        # walk through all places within the table matching the transition
+        places = self.places(transition.begin(), transition.end())
+        while places:
+            begin, end = places.pop(0)
+            # check if place is empty
+            if overwrite or not self.transitions[begin][end]:
+                log.debug("adding transition %s = %s -> %s\n%s" %
+                          (transition.name(), self.targets[begin].name, self.targets[end].name, transition))
+                # calculate transition if necessary
+                if not calculated:
+                    if self.parametric:
+                        transition.parametrize()
+                    elif self.pending is None:
+                        transition.calculate(frames,
+                                             precision=self.precision)
+                    else:
+                        self.pending[id(transition)] = (transition, frames)
+                    # calculation may change the end composite so go on
+                    # with the places matching the calculated transition
+                    places = [p for p in self.places(transition.begin(),
+                                                     transition.target())
+                              if p > (begin, end)]
+                # add transition to table
+                self.transitions[begin][end] = transition
+
+    def places(self, begin, end):
+        """ return all (begin, end) index pairs within the transition table
+            which are matching the given composites in row-major order
+        """
+        return [(b, e)
+                for b in self.index.get(begin.signature(), [])
+                for e in self.index.get(end.signature(), [])]
 
     def count(self):
         """ count available transition
@@ -88,28 +215,55 @@ class Transitions:
                     n += 1
         return n
 
-    def configure(cfg, composites, targets, fps=25):
+    def configure(cfg, composites, targets, fps=25, lazy=False, cache_size=None,
+                  jobs=1, precision=None, parametric=False, stats=None):
         """ generate all transitions configured in the INI-like configuration
             string in <cfg> by using the given <composites> and return them
-            in a dictonary
+            in a dictonary. If <lazy> transitions will be calculated on their
+            first find() and at most <cache_size> frames will be kept.
+            Otherwise calculation is spread over <jobs> processes (as many
+            as CPUs available if None). Movement paths are sampled with
+            <precision> pixels if given (see bspline()).
+            If <parametric> no frames will be calculated but transitions can
+            be evaluated at any time by Transition.at().
+            If a Stats object is given in <stats> configuration is measured
+            into it and it will be attached to the result as <stats>.
         """
-        def index(composite):
-            for i in range(len(targets)):
-                if composites[targets[i]].equals(composite, True):
-                    return i
-            return None
+        if stats is not None:
+            with stats:
+                transitions = Transitions.configure(
+                    cfg, composites, targets, fps, lazy, cache_size, jobs,
+                    precision, parametric)
+            transitions.stats = stats
+            stats.transitions = transitions
+            return transitions
 
         def convert(keys, conv):
             return [keys, keys.reversed(), keys.swapped(), keys.reversed().swapped()][conv]
 
-        # prepare result
-        transitions = Transitions(targets)
+        # prepare result (collect transitions lazily to calculate in parallel)
+        parallel = not lazy and not parametric and jobs != 1
+        transitions = Transitions(targets, lazy or parallel, cache_size,
+                                  precision, parametric)
+        # visual keys of all sequences added so far
+        seen = set()
 
         # walk through all items within the configuration string
         for t_name, t in cfg:
-            # split animation time and composite sequence from t
-            time, sequence = t.split(',')
+            # split animation time, composite sequence and optional easing
+            # curve from t
+            values = t.split(',')
+            if len(values) not in [2, 3]:
+                raise RuntimeError(
+                    'transition {} must be "time, sequence[, easing]" but is "{}"'.format(
+                        t_name, t))
+            time, sequence, *easing = values
             time = int(time)
+            easing = easing[0].strip() if easing else DEFAULT_EASING
+            if easing not in EASINGS:
+                raise RuntimeError(
+                    'easing "{}" of transition {} is unknown (use one of {})'.format(
+                        easing, t_name, ", ".join(EASINGS)))
             # calculate frames needed for that animation time
             frames = fps * float(time) / 1000.0
             # split sequence list into key frames
@@ -120,52 +274,176 @@ class Transitions:
                         name = "%s(%s)" % (t_name, "/".join(seq))
                     else:
                         name = t_name
-                    # prepare list of key frame composites
-                    keys = Transition(name)
                     try:
                         # walk trough composite sequence
-                        for c_name in seq:
-                            if c_name[0] == '^':
-                                # find a composite with that name
-                                keys.append(composites[c_name[1:]].swapped())
-                            else:
-                                # find a composite with that name
-                                keys.append(composites[c_name])
+                        key_frames = [composites[c_name[1:]].swapped()
+                                      if c_name[0] == '^'
+                                      else composites[c_name]
+                                      for c_name in seq]
                     # log any failed find
                     except KeyError as err:
                         raise RuntimeError(
                             'composite "{}" could not be found in transition {}'.format(err, name))
+                    # skip sequences which look like one we already added
+                    key = (conversion, time, easing, tuple(
+                        tuple(f.signature() for f in c.frame)
+                        for c in key_frames))
+                    if key in seen:
+                        transitions.skipped += 1
+                        continue
+                    seen.add(key)
+                    transitions.kept += 1
+                    # prepare list of key frame composites
+                    keys = Transition(name)
+                    keys.duration = time / 1000.0
+                    keys.easing = easing
+                    for c in key_frames:
+                        keys.append(c)
                     transitions.add(convert(keys, conversion), frames - 1)
+        log.info("kept %d unique transition sequence(s) and skipped %d" %
+                 (transitions.kept, transitions.skipped))
+        if parallel:
+            transitions.precalculate(jobs)
         # return dictonary
         return transitions
 
-    def travel(composites, previous=None):
-        """ return a list of pairs of composites along all possible transitions
-            between all given composites by walking the tree of all combinations
-        """
-        # if there is only one composite
-        if len(composites) == 1:
-            # transition to itself
-            return [composites[0], composites[0]]
-        # if call is not from recursion
-        if not previous:
-            # insert random first station
-            return Transitions.travel(composites, composites[0:1])
-        # if maximum length has been reached
-        if len(previous) == len(composites) * len(composites) + 1:
-            # return ready sequence
-            return previous
-        # for all composites
-        for a in composites:
-            # check if we haven't had that combination previously
-            if not is_in(previous, [previous[-1], a]):
-                # try that combination
-                r = Transitions.travel(composites, previous + [a])
-                # return result if we are ready here
-                if r:
-                    return r
-        # no findings
-        return None
+    def save(self, filename, key):
+        """ write calculated transition table into a cache file which can be
+            loaded by load() with the same <key> (see cache_key()). Of a
+            parametric table only the key composites are written and the
+            paths will be fitted again when loading.
+        """
+        # collect distinct transitions (they are shared between table places)
+        unique, ids, table = [], dict(), []
+        for tt in self.transitions:
+            row = []
+            for t in tt:
+                if t and id(t) not in ids:
+                    ids[id(t)] = len(unique)
+                    unique.append(t)
+                row.append(ids[id(t)] if t else -1)
+            table.append(row)
+        # put all frames of all transitions into one array
+        data, items, offset = [], [], 0
+        for t in unique:
+            if self.pending is not None:
+                # calculate lazy transition if necessary
+                self.calculate(t)
+            animation = (t.composites if type(t.composites) is Animation
+                         else pack(t.composites))
+            data.append(animation.data)
+            items.append({"name": t._name,
+                          "duration": t.duration,
+                          "easing": t.easing,
+                          "offset": offset,
+                          "names": list(animation.names),
+                          "keys": np.flatnonzero(animation.keys).tolist(),
+                          "integer": np.flatnonzero(animation.integer).tolist(),
+                          "configs": [[i, c] for i, c
+                                      in enumerate(animation.configs) if c]})
+            offset += t.frames()
+        data = (np.concatenate(data) if data
+                else np.zeros((0, self.targets[0].sources() if self.targets
+                               else 2, CACHE_VALUES), dtype='<f8'))
+        header = json.dumps({"key": key,
+                             "parametric": self.parametric,
+                             "targets": [t.name for t in self.targets],
+                             "table": table,
+                             "transitions": items,
+                             "rows": len(data),
+                             "crc": zlib.crc32(data)}).encode()
+        # write into temporary file and replace afterwards
+        with open(filename + ".tmp", "wb") as f:
+            f.write(CACHE_MAGIC)
+            f.write(len(header).to_bytes(4, "little"))
+            f.write(header)
+            # align frame data to 8 bytes to be able to map it into memory
+            f.write(bytes(-f.tell() % 8))
+            f.write(data.tobytes())
+        os.replace(filename + ".tmp", filename)
+
+    def load(filename, key, targets):
+        """ load transition table for the given <targets> from a cache file
+            which was written by save(). Returns None if the file is missing,
+            does not match <key> and <targets> or seems to be corrupt.
+        """
+        try:
+            with open(filename, "rb") as f:
+                if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    raise ValueError("not a transition cache file")
+                length = int.from_bytes(f.read(4), "little")
+                header = json.loads(f.read(length).decode())
+                offset = f.tell() + (-f.tell() % 8)
+            if (header["key"] != key or
+                    header["targets"] != [t.name for t in targets]):
+                log.info("transition cache '%s' is outdated" % filename)
+                return None
+            shape = (header["rows"], targets[0].sources() if targets else 2,
+                     CACHE_VALUES)
+            # map frame data into memory
+            data = (np.memmap(filename, dtype='<f8', mode='r',
+                              offset=offset, shape=shape)
+                    if header["rows"] else np.zeros(shape))
+            if zlib.crc32(data) != header["crc"]:
+                raise ValueError("checksum mismatch")
+            size = targets[0].A().original_size if targets else [0, 0]
+            # rebuild distinct transitions
+            unique = [Transition.unpack(item, data, size)
+                      for item in header["transitions"]]
+            transitions = Transitions(targets,
+                                      parametric=header.get("parametric",
+                                                            False))
+            if transitions.parametric:
+                for t in unique:
+                    # parametric transitions keep their key composites
+                    t.composites = list(t.composites)
+                    t.parametrize()
+            for b in range(len(targets)):
+                for e in range(len(targets)):
+                    n = header["table"][b][e]
+                    transitions.transitions[b][e] = unique[n] if n >= 0 else None
+            return transitions
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as err:
+            log.warning("transition cache '%s' is corrupt: %s" %
+                        (filename, err))
+            return None
+
+    def project(self, size, targets=None):
+        """ return a copy of this transition table projected to output
+            <size> without recalculating any transitions. <targets> can be
+            given if the projected targets are already available.
+        """
+        assert self.pending is None, "can not project lazy transitions"
+        if targets is None:
+            targets = [t.projected(size) for t in self.targets]
+        result = Transitions(targets, precision=self.precision,
+                             parametric=self.parametric)
+        # project every distinct transition and key composite once
+        projected, keys = dict(), dict()
+        for b in range(len(self.targets)):
+            for e in range(len(self.targets)):
+                t = self.transitions[b][e]
+                if t and id(t) not in projected:
+                    projected[id(t)] = t.projected(size, keys)
+                result.transitions[b][e] = projected[id(t)] if t else None
+        return result
+
+    def travel(composites):
+        """ return a sequence of composites which walks along every possible
+            transition between all given composites exactly once
+        """
+        # the transitions build a complete directed graph with loops which
+        # is walked by the lexicographically least de Bruijn sequence of
+        # order 2 (concatenation of Lyndon words of length 1 and 2)
+        sequence = []
+        for i, a in enumerate(composites):
+            sequence.append(a)
+            for b in composites[i + 1:]:
+                sequence += [a, b]
+        # return to where we started
+        return sequence + composites[:1]
 
 
 class Transition:
@@ -189,6 +467,13 @@ class Transition:
                 self.composites = a
         else:
             self.composites = []
+        # duration in seconds (if known)
+        self.duration = None
+        # name of the easing curve (see EASINGS)
+        self.easing = DEFAULT_EASING
+        # parametric movement paths of A and B (see parametrize())
+        self.paths = None
+        self.key_names = None
 
     def __str__(self):
         # remember index when to flip sources A/B
@@ -196,23 +481,28 @@ class Transition:
         str = "\t%s = %s -> %s:\n" % (self.name(),
                                       self.begin().name, self.end().name)
         # add table title
-        str += "\tNo. %s\n" % Composite.str_title()
-        # add composites until flipping point
-        for i in range(flip_at if flip_at is not None else self.frames()):
-            str += ("\t%3d %s A%s\tB%s  %s\n" %
-                    (i, " * " if self.A(i).key else "   ", self.A(i), self.B(i), self.composites[i].name))
-        # add composites behind flipping point
-        if flip_at is not None:
-            str += ("\t-----------------------------------------------------------"
-                    " FLIP SOURCES "
-                    "------------------------------------------------------------\n")
-            for i in range(flip_at, self.frames()):
-                str += ("\t%3d %s B%s\tA%s  %s\n" %
-                        (i, " * " if self.A(i).key else "   ", self.A(i), self.B(i), self.composites[i].name))
+        sources = self.begin().sources()
+        str += "\tNo. %s\n" % Composite.str_title(sources)
+        # label sources and swap labels of A and B behind the flipping point
+        labels = [l.upper() for l in SOURCES[:sources]]
+        flipped = labels[1::-1] + labels[2:]
+        for i in range(self.frames()):
+            if i == flip_at:
+                # add composites behind flipping point
+                str += ("\t-----------------------------------------------------------"
+                        " FLIP SOURCES "
+                        "------------------------------------------------------------\n")
+            c = self.composites[i]
+            str += ("\t%3d %s %s  %s\n" %
+                    (i, " * " if c.A().key else "   ",
+                     "\t".join(["%s%s" % (l, f) for l, f in
+                                zip(flipped if flip_at is not None and
+                                    i >= flip_at else labels, c.frame)]),
+                     c.name))
         return str
 
     def phi(self):
-        return self.begin().equals(self.end().swapped(), True)
+        return self.begin().equals(self.target().swapped(), True)
 
     def name(self):
         if self.phi():
@@ -227,28 +517,126 @@ class Transition:
     def frames(self): return len(self.composites)
 
     def A(self, n=None):
-        if n is None:
-            return [c.A() for c in self.composites]
-        else:
-            assert type(n) is int
-            return self.composites[n].A()
+        return self.source(0, n)
 
     def B(self, n=None):
+        return self.source(1, n)
+
+    def source(self, s, n=None):
+        """ return the frame of source <s> (0=A, 1=B, 2=C, ...) in composite
+            <n> or a list of them in all composites if <n> is None
+        """
         if n is None:
-            return [c.B() for c in self.composites]
+            return [c.source(s) for c in self.composites]
         else:
             assert type(n) is int
-            return self.composites[n].B()
+            if type(self.composites) is Animation:
+                return self.composites.frame(n, s)
+            return self.composites[n].source(s)
 
     def begin(self): return self.composites[0]
 
     def end(self): return self.composites[-1]
 
+    def target(self):
+        """ return the end composite this transition has after calculation
+            (calculate() swaps the end if it looks like the begin)
+        """
+        begin, end = self.begin(), self.end()
+        if all(b == e for b, e in zip(begin.frame, end.frame)):
+            return Composite(end.order, end.name, end.B(), end.A(),
+                             *end.frame[2:])
+        return end
+
     def reversed(self):
-        return Transition(self._name + "⁻¹", self.composites[::-1])
+        t = Transition(self._name + "⁻¹", self.composites[::-1])
+        t.duration = self.duration
+        t.easing = self.easing
+        return t
+
+    def copied(self):
+        """ return a copy of this transition which keeps the current
+            composites even if this one gets reset by a lazy table
+            (see Transitions.calculate())
+        """
+        t = Transition(self._name, self.composites)
+        t.duration = self.duration
+        t.easing = self.easing
+        t.paths = self.paths
+        t.key_names = self.key_names
+        return t
 
     def swapped(self):
-        return Transition(swap_name(self._name), [c.swapped() for c in self.composites])
+        t = Transition(swap_name(self._name), [c.swapped() for c in self.composites])
+        t.duration = self.duration
+        t.easing = self.easing
+        return t
+
+    def projected(self, size, keys=None):
+        """ return a copy of this transition projected to output <size>
+            (parametric paths will be fitted again when needed). <keys> may
+            be a dictionary to share projected key composites in (see
+            Animation.project()).
+        """
+        if type(self.composites) is Animation:
+            t = Transition(self._name,
+                           self.composites.project(size, EASINGS[self.easing],
+                                                   keys))
+        else:
+            t = Transition(self._name,
+                           [c.projected(size) for c in self.composites])
+        t.duration = self.duration
+        t.easing = self.easing
+        return t
+
+    def parametrize(self, a_corner=(R, T), b_corner=(L, T)):
+        """ fit the movement paths of A and B along the key composites
+            (like calculate() does but without generating any frames) to be
+            able to evaluate this transition at any time by at()
+        """
+        keys, frames = self.key_frames()
+        ease = EASINGS[self.easing]
+        self.paths = [Path(f, c, ease) for f, c in
+                      zip(frames, corners(len(frames), a_corner, b_corner))]
+        self.key_names = [c.name for c in keys]
+
+    def at(self, t):
+        """ return the composite at time <t> (in seconds) within this
+            transition
+        """
+        assert self.duration, "transition has no duration"
+        return self.at_fraction(t / self.duration)
+
+    def at_fraction(self, x):
+        """ return the composite at position <x> (0.0..1.0) within this
+            transition
+        """
+        if not self.paths:
+            self.parametrize()
+        x = min(max(x, 0.0), 1.0)
+        # name composite like the key composite if we hit one
+        k = x * (len(self.key_names) - 1)
+        name = self.key_names[int(k)] if k == int(k) else "..."
+        return Composite(0, name, *[p.at(x) for p in self.paths])
+
+    def unpack(item, data, size):
+        """ rebuild a transition from a cache file <item> (see
+            Transitions.save()) which refers to its frames in array <data>
+        """
+        n = len(item["names"])
+        keys = np.zeros(n, dtype=bool)
+        keys[item["keys"]] = True
+        integer = np.zeros(n, dtype=bool)
+        integer[item["integer"]] = True
+        configs = [None] * n
+        for i, c in item.get("configs", []):
+            configs[i] = tuple(tuple(f) if f else None for f in c)
+        t = Transition(item["name"],
+                       Animation(data[item["offset"]:item["offset"] + n],
+                                 item["names"], keys, integer, size, configs))
+        t.duration = item["duration"]
+        t.easing = item.get("easing", DEFAULT_EASING)
+        return t
 
     def flip(self):
         """ find the first non overlapping rectangle pair within parameters and
@@ -272,10 +660,11 @@ class Transition:
         # no flipping
         return None
 
-    def calculate(self, frames, a_corner=(R, T), b_corner=(L, T)):
+    def calculate(self, frames, a_corner=(R, T), b_corner=(L, T), precision=None):
         """ calculate a transition between the given composites which shall
             have the given amount of frames. Use a_corner of frames in A and
             b_corner of frames in B to interpolate the animation movement.
+            Sample movement paths with <precision> pixels (see bspline()).
         """
         if len(self.composites) != frames:
             if len(self.composites) != len(self.keys()):
@@ -284,168 +673,825 @@ class Transition:
             # calculate that transition and place it into the dictonary
             log.debug("calculating transition %s = %s" %
                       (self.name(), "/".join([c.name for c in self.composites])))
+            # store calculated composites into one compact array
+            moves = list(self.moves(frames, a_corner, b_corner, precision))
+            self.composites = Animation(
+                np.concatenate([m.data for m in moves]),
+                [name for m in moves for name in m.names],
+                np.concatenate([m.keys for m in moves]),
+                np.concatenate([m.integer for m in moves]),
+                moves[0].size,
+                [c for m in moves for c in m.configs])
+
+    def generate(self, frames, a_corner=(R, T), b_corner=(L, T), precision=None):
+        """ generate the composites of this transition one by one from its
+            key composites (see calculate() about the parameters)
+        """
+        i = 0
+        for move in self.moves(frames, a_corner, b_corner, precision):
+            for c in move:
+                # number composites throughout the whole transition
+                c.order = i
+                i += 1
+                yield c
 
-            # extract two lists of frames for use with interpolate()
-            a = [c.A() for c in self.composites]
-            b = [c.B() for c in self.composites]
-            # check if begin and end of animation are equal
-            if a[-1] == a[0] and b[-1] == b[0]:
-                # then swap the end composite
-                a[-1], b[-1] = b[-1], a[-1]
-            # generate animation
-            a = interpolate(a, frames, a_corner)
-            b = interpolate(b, frames, b_corner)
-            composites = []
-            j = 0
-            for i in range(len(a)):
-                if a[i].key:
-                    name = self.composites[j].name
-                    j += 1
-                else:
-                    name = "..."
-                composites.append(Composite(len(composites), name, a[i], b[i]))
-            self.composites = composites
+    def moves(self, frames, a_corner=(R, T), b_corner=(L, T), precision=None):
+        """ yield the composites of this transition as Animations which are
+            calculated for all sources at once. The first one only holds the
+            first key composite and every other one a move to the next key
+            composite (see calculate() about the parameters).
+        """
+        keys, key_frames = self.key_frames()
+        size = keys[0].A().original_size
+        j = 0
+        for data in iter_interpolate_sources(
+                key_frames, frames,
+                corners(len(key_frames), a_corner, b_corner), precision,
+                EASINGS[self.easing]):
+            # every move ends with the key composite
+            is_key = np.zeros(len(data), dtype=bool)
+            is_key[-1] = any(f[j].key for f in key_frames)
+            integer = np.zeros(len(data), dtype=bool)
+            integer[-1] = all(type(x) is int for f in key_frames
+                              for x in f[j].rect)
+            configs = [None] * len(data)
+            configs[-1] = tuple(f[j].config for f in key_frames)
+            yield Animation(data,
+                            ["..."] * (len(data) - 1) + [keys[j].name],
+                            is_key, integer, size, configs)
+            j += 1
+
+    def key_frames(self):
+        """ return the key composites and the lists of their frames of every
+            source to interpolate (the end composite's sources A and B are
+            swapped if it looks like the begin)
+        """
+        keys = self.keys()
+        frames = [[c.source(s) for c in keys]
+                  for s in range(keys[0].sources())]
+        # check if begin and end of animation are equal
+        if all(f[-1] == f[0] for f in frames):
+            # then swap the end composite
+            frames[0][-1], frames[1][-1] = frames[1][-1], frames[0][-1]
+        return keys, frames
+
+    def iter_frames(self, frames=None, a_corner=(R, T), b_corner=(L, T),
+                    precision=None):
+        """ yield the composites of this transition one by one. If this
+            transition is not calculated yet and <frames> is given they will
+            be calculated on the fly without being stored (see calculate()
+            about the parameters).
+        """
+        if frames is None or type(self.composites) is Animation:
+            yield from self.composites
+        else:
+            yield from self.generate(frames, a_corner, b_corner, precision)
 
     def keys(self):
         """ return the indices of all key composites
         """
         return [i for i in self.composites if i.key()]
 
+    def retarget(self, i, target, frames):
+        """ return a new transition of <frames> frames from composite <i> of
+            this transition to <target> which starts with the velocity this
+            transition has at composite <i> and eases into <target> along
+            the easing curve of this transition. Cheap enough to be used
+            while switching.
+        """
+        frames = max(int(round(frames)), 2)
+        n = len(self.composites)
+        begin = self.composites[i]
+        packed = pack([begin, self.composites[min(i + 1, n - 1)], target])
+        # ease positions and sizes instead of all borders independently so
+        # that no rectangle gets turned inside out
+        values = packed.data.copy()
+        values[:, :, R:B + 1] -= values[:, :, L:T + 1]
+        x = np.linspace(0.0, 1.0, frames)[:, None, None]
+        ease = EASINGS[self.easing]
+        # scale the velocity so that the first step (including the one of
+        # the easing curve) is the one this transition would have done next
+        velocity = ((values[1] - values[0] - (values[2] - values[0]) *
+                     ease(x[1])) / (x[1] * (1.0 - x[1])**2)
+                    if frames > 2 else 0.0)
+        # ease from begin to target and let the velocity decay to zero
+        data = (values[0] + (values[2] - values[0]) * ease(x)
+                + velocity * x * (1.0 - x)**2)
+        data[:, :, R:B + 1] = (np.maximum(data[:, :, R:B + 1], 0.0) +
+                               data[:, :, L:T + 1])
+        # round cropping and alpha like fade() does with integers
+        data[:, :, B + 1:] = np.rint(data[:, :, B + 1:])
+        data[:, :, B + 1:B + 5] = np.maximum(data[:, :, B + 1:B + 5], 0.0)
+        data[:, :, B + 5] = np.clip(data[:, :, B + 5], 0.0, 255.0)
+        data[0], data[-1] = packed.data[0], packed.data[2]
+        keys = np.zeros(frames, dtype=bool)
+        keys[[0, -1]] = True
+        integer = np.zeros(frames, dtype=bool)
+        integer[[0, -1]] = packed.integer[[0, 2]]
+        t = Transition("%s→%s" % (self._name, target.name),
+                       Animation(data,
+                                 [begin.name] + ["..."] * (frames - 2) +
+                                 [target.name],
+                                 keys, integer, begin.A().original_size,
+                                 [packed.configs[0]] + [None] * (frames - 2) +
+                                 [packed.configs[2]]))
+        if self.duration:
+            t.duration = self.duration * (frames - 1) / max(n - 1, 1)
+        t.easing = self.easing
+        return t
+
+
+class TransitionPlayer:
+    """ plays transitions of a transition table in real time by returning
+        the composite which is due at any output timestamp
+    """
+
+    def __init__(self, transitions, composite, fps=25, clock=time.monotonic):
+        self.transitions = transitions
+        # output frame rate
+        self.fps = fps
+        # clock in seconds to use when no timestamps are given
+        self.clock = clock
+        # composite to find the next transition from
+        self.target = composite
+        # composite to show while no transition is running
+        self.current = composite
+        # running transition and its composites (also as a transition), start
+        # time and flip index
+        self.transition = None
+        self.frames = None
+        self.playing = None
+        self.start = None
+        self.flip_at = None
+        # index of the frame which was returned last
+        self.last = None
+        # if sources A and B have to be swapped within the last composite
+        self.swapped = False
+        # number of frames played, returned again or dropped, number of
+        # late calls and maximum lateness in seconds
+        self.played = 0
+        self.repeated = 0
+        self.dropped = 0
+        self.late = 0
+        self.max_lateness = 0.0
+
+    def running(self):
+        return self.transition is not None
+
+    def switch(self, target, timestamp=None):
+        """ start the transition from the current composite to <target>
+            with its first frame at <timestamp> (now if not given) and return
+            it. Cuts to <target> and returns None if there is no such
+            transition. A running transition will be retargeted from the
+            frame shown last (see Transition.retarget()).
+        """
+        if timestamp is None:
+            timestamp = self.clock()
+        if self.transition is not None:
+            # lazy transitions are not calculated just to be retargeted
+            transition = self.transitions.lookup(self.target, target)
+        else:
+            transition = self.transitions.find(self.target, target)
+        self.target = target
+        if not transition:
+            self.transition = None
+            self.current = target
+            self.swapped = False
+            return None
+        if self.transition is not None:
+            return self.retarget(transition, target, timestamp)
+        self.swapped = False
+        # create all composites now to keep composite() cheap
+        self.frames = playable(transition, self.fps)
+        self.playing = Transition(transition.name(), self.frames)
+        self.flip_at = self.playing.flip()
+        self.transition = transition
+        self.start = timestamp
+        self.last = None
+        return transition
+
+    def retarget(self, transition, target, timestamp):
+        """ replace the running transition by one from the frame shown last
+            to <target> which takes as long as <transition> (the one from the
+            previous target) would have and return it
+        """
+        i = 0 if self.last is None else self.last
+        if self.swapped:
+            # keep sources swapped like they are displayed now
+            target = target.swapped()
+        pending = self.transitions.pending
+        if pending and id(transition) in pending:
+            # as many frames as calculate() would generate of the key frames
+            moves = transition.frames() - 1
+            frames = (int(round(pending[id(transition)][1] / moves)) * moves
+                      + 1)
+        else:
+            frames = playable_frames(transition, self.fps)
+        retargeted = self.playing.retarget(i, target, frames)
+        self.frames = list(retargeted.composites)
+        self.playing = retargeted
+        self.flip_at = 0 if self.swapped else None
+        self.transition = retargeted
+        if self.last is not None:
+            # the first frame is the one shown last so keep its due time
+            self.start += self.last / self.fps
+            self.last = 0
+        else:
+            self.start = timestamp
+        return retargeted
+
+    def composite(self, timestamp=None):
+        """ return the composite which is due at output <timestamp> (now if
+            not given). Frames which have been missed are skipped and
+            counted as dropped.
+        """
+        if self.transition is None:
+            return self.current
+        if timestamp is None:
+            timestamp = self.clock()
+        # tolerate rounding of timestamps exactly at the due time
+        i = int((timestamp - self.start) * self.fps + 1e-6)
+        end = len(self.frames) - 1
+        if i > end:
+            i = end
+        elif i < 0:
+            i = 0
+        expected = 0 if self.last is None else self.last + 1
+        if i >= expected:
+            if i > expected:
+                # skip the frames we are too late for
+                self.dropped += i - expected
+                self.late += 1
+                lateness = timestamp - self.start - expected / self.fps
+                if lateness > self.max_lateness:
+                    self.max_lateness = lateness
+            self.played += 1
+            self.last = i
+            self.swapped = self.flip_at is not None and i >= self.flip_at
+        else:
+            self.repeated += 1
+        composite = self.frames[i]
+        if i == end:
+            # transition is finished
+            self.transition = None
+            self.current = composite
+        return composite
+
+
+class Animation:
+    """ read-only sequence of calculated composites which are stored within
+        one contiguous array of frames x sources x values (L, T, R, B,
+        crop L, crop T, crop R, crop B, alpha). Composites and frames will be
+        created on access.
+    """
+
+    def __init__(self, data, names, keys, integer, size, configs=None):
+        assert data.shape[1] >= 2 and data.shape[2] == CACHE_VALUES
+        self.data = data
+        # composite names
+        self.names = names
+        # which composites are key composites
+        self.keys = keys
+        # which composites have integer coordinates
+        self.integer = integer
+        # original size of all frames
+        self.size = size
+        # configured values of all sources of every composite or None (see
+        # Frame.config)
+        self.configs = configs if configs is not None else [None] * len(data)
+
+    def __len__(self): return len(self.data)
+
+    def __iter__(self):
+        # converting all values at once is much faster than frame by frame
+        data = self.data.tolist()
+        keys = self.keys.tolist()
+        integer = self.integer.tolist()
+        for i in range(len(data)):
+            config = self.configs[i] or [None] * len(data[i])
+            yield Composite(i, self.names[i],
+                            *[self.unpacked(v, keys[i], integer[i], c)
+                              for v, c in zip(data[i], config)])
+
+    def __getitem__(self, i):
+        if type(i) is slice:
+            # slices are views into the same data
+            return Animation(self.data[i], self.names[i], self.keys[i],
+                             self.integer[i], self.size, self.configs[i])
+        if i < 0:
+            i += len(self.data)
+        return Composite(i, self.names[i],
+                         *[self.frame(i, s) for s in range(self.data.shape[1])])
+
+    def project(self, size, ease=None, keys=None):
+        """ return a copy of this animation projected to output <size>.
+            Key composites are projected like Composite.projected() does.
+            All others are scaled and corrected by the projection error of
+            the surrounding key composites which is blended by <ease>.
+            Projected key composites are looked up in and added to the
+            dictionary <keys> if one is given.
+        """
+        if keys is None:
+            keys = dict()
+        scale = np.array([size[X] / self.size[X], size[Y] / self.size[Y]] * 4
+                         + [1.0])
+        data = self.data * scale
+        anchors = np.flatnonzero(self.keys)
+        if len(anchors):
+            # projection error of every key composite
+            error = np.array([self.projected_key(i, size, keys)
+                              for i in anchors]) - data[anchors]
+            # blend between the errors of the previous and the next key
+            rows = np.arange(len(data))
+            k = np.maximum(np.searchsorted(anchors, rows, 'right') - 1, 0)
+            n = np.minimum(k + 1, len(anchors) - 1)
+            x = np.clip((rows - anchors[k]) /
+                        np.maximum(anchors[n] - anchors[k], 1), 0.0, 1.0)
+            x = (ease(x) if ease else x)[:, None, None]
+            data += error[k] + (error[n] - error[k]) * x
+        return Animation(data, self.names, self.keys, self.integer, size,
+                         self.configs)
+
+    def projected_key(self, i, size, keys):
+        """ return the values of key composite <i> projected to <size> from
+            dictionary <keys> or project it into there
+        """
+        key = (self.data[i].tobytes(), repr(self.configs[i]), tuple(size))
+        if key not in keys:
+            keys[key] = [list(f.rect) + list(f.crop) + [f.alpha]
+                         for f in (self.frame(i, s).projected(size)
+                                   for s in range(self.data.shape[1]))]
+        return keys[key]
+
+    def frame(self, i, source):
+        """ return frame of <source> (0=A, 1=B, 2=C, ...) in composite <i>
+        """
+        # converting the values at once is much faster than one by one
+        return self.unpacked(self.data[i, source].tolist(), self.keys[i],
+                             self.integer[i],
+                             self.configs[i][source] if self.configs[i]
+                             else None)
+
+    def unpacked(self, v, key, integer, config=None):
+        """ return frame from list of values <v> (see frame())
+        """
+        return FrozenFrame([int(x) for x in v[L:B + 1]] if integer
+                           else v[L:B + 1],
+                           [int(x) for x in v[B + 1:B + 5]],
+                           int(v[B + 5]),
+                           self.size,
+                           bool(key),
+                           config)
+
+
+def pack(composites):
+    """ store list of <composites> into an Animation
+    """
+    return Animation(np.array([[list(f.rect) + list(f.crop) + [f.alpha]
+                                for f in c.frame] for c in composites],
+                              dtype='<f8').reshape(
+                                  -1, composites[0].sources() if composites
+                                  else 2, CACHE_VALUES),
+                     [c.name for c in composites],
+                     np.array([c.key() for c in composites], dtype=bool),
+                     np.array([all(type(x) is int
+                                   for f in c.frame for x in f.rect)
+                               for c in composites], dtype=bool),
+                     composites[0].A().original_size if composites else None,
+                     [tuple(f.config for f in c.frame)
+                      if any(f.config for f in c.frame) else None
+                      for c in composites])
+
+
+class Path:
+    """ parametric movement of one corner of a frame along key frames which
+        can be evaluated at any position
+    """
+
+    def __init__(self, key_frames, corner, ease=None):
+        self.key_frames = key_frames
+        self.corner = corner
+        # easing curve (see EASINGS)
+        self.ease = ease or smooth
+        corners = np.array([f.corner(corner[X], corner[Y])
+                            for f in key_frames])
+        # fit spline and measure its length at a fine resolution
+        self.points = distinct(corners)
+        self.tck = fit(self.points)
+        self.u = np.linspace(0, 1, 1001)
+        spline = evaluate(self.tck, self.points, self.u)
+        self.positions = measure(np.transpose(spline))[:, V]
+        # get distances of the key frames on the path (from its begin to
+        # its end even if it returns to where it began)
+        stops = find_nearest(spline, corners)
+        stops[0], stops[-1] = 0, len(self.u) - 1
+        self.stops = self.positions[stops]
+
+    def at(self, x):
+        """ return frame at position <x> (0.0..1.0) along the path
+        """
+        # find the move between two key frames we are in
+        moves = len(self.key_frames) - 1
+        i = min(int(x * moves), moves - 1)
+        x0, x1 = i / moves, (i + 1) / moves
+        if x == x0 or x == x1:
+            return self.key_frames[i if x == x0 else i + 1]
+        # distribute smoothly like distribute() does
+        ease = self.ease
+        length = self.stops[i + 1] - self.stops[i]
+        pos = ((ease(x) - ease(x0)) / (ease(x1) - ease(x0)) * length
+               + self.stops[i])
+        # find spline parameter at that distance and evaluate there
+        u = np.interp(pos, self.positions, self.u)
+        pt = evaluate(self.tck, self.points, u)
+        # morph frame with the same smoothing like interpolate() does
+        return morph(self.key_frames[i], self.key_frames[i + 1], pt,
+                     self.corner, ease((x - x0) * moves)).freeze()
+
+
+def playable(transition, fps):
+    """ return a list of all composites of <transition> to play it with <fps>
+        frames per second (parametric transitions will be evaluated at that
+        rate)
+    """
+    if transition.paths and type(transition.composites) is not Animation:
+        n = playable_frames(transition, fps)
+        return [transition.at_fraction(i / (n - 1)) for i in range(n)]
+    return list(transition.composites)
+
+
+def playable_frames(transition, fps):
+    """ return the number of composites playable() returns for <transition>
+    """
+    if transition.paths and type(transition.composites) is not Animation:
+        return max(int(round(transition.duration * fps)), 2)
+    return len(transition.composites)
+
+
+def calculated(transition, frames, precision=None):
+    """ calculate <transition> with <frames> frames and return the resulting
+        composites (used as worker function by Transitions.precalculate())
+    """
+    transition.calculate(frames, precision=precision)
+    return transition.composites
+
+
+def cache_key(composites_cfg, transitions_cfg, size, fps, precision=None,
+              parametric=False):
+    """ return a hash of everything a calculated transition table depends on
+        which can be used as <key> in Transitions.save() and load()
+    """
+    return hashlib.sha256(repr((CACHE_VERSION,
+                                list(composites_cfg),
+                                list(transitions_cfg),
+                                list(size),
+                                fps,
+                                precision,
+                                parametric)).encode()).hexdigest()
+
 
 def parse_asterisk(sequence, composites):
-    """ parses a string like '*/*' and returns all available variants with '*'
-        being replaced by composite names in 'composites'.
+    """ parses a string like '*/*' and yields all available variants with '*'
+        being replaced by composite names in 'composites'. Every variant is
+        yielded once and the last '*' changes fastest.
     """
-    sequences = []
-    for k in range(len(sequence)):
-        if sequence[k] == '*':
-            for c in composites:
-                sequences += parse_asterisk(sequence[: k] +
-                                            [c.name] + sequence[k + 1:],
-                                            composites)
-    if not sequences:
-        sequences.append(sequence)
-    return sequences
+    # positions of the wildcards within the sequence
+    wildcards = [k for k in range(len(sequence)) if sequence[k] == '*']
+    for names in itertools.product([c.name for c in composites],
+                                   repeat=len(wildcards)):
+        variant = list(sequence)
+        for k, name in zip(wildcards, names):
+            variant[k] = name
+        yield variant
 
 
 def frange(x, y, jump):
     """ like range() but for floating point values
+        (returns an array of the values which are accumulated like in a loop)
     """
-    while x < y:
-        yield x
-        x += jump
+    # accumulate steps sequentially to get the very same rounding as a loop
+    values = np.cumsum(np.full(int((y - x) / jump) + 2, jump))
+    values = np.concatenate(([x], x + values))
+    return values[values < y]
 
 
-def bspline(points):
+def bspline(points, precision=None):
     """ do a B - Spline interpolation between the given points
-        returns interpolated points
+        returns interpolated points. Without <precision> the path is sampled
+        at a fixed resolution, otherwise the number of samples is chosen
+        from the bending of the path so that the chords between neighbouring
+        samples stay within <precision> pixels of it (and all given points
+        are samples) to interpolate positions in between (see distribute()).
     """
     # parameter check
     assert type(points) is np.ndarray
     assert type(points[0]) is np.ndarray and len(points[0]) == 2
     assert type(points[1]) is np.ndarray and len(points[1]) == 2
+    # no spline can be fitted through equal points
+    points = distinct(points)
     # calculation resolution
     resolution = 0.001
     # check if we have more than two points
     if len(points) > 2:
         # do interpolation
-        tck, u = spi.splprep(points.transpose(), s=0, k=2)
-        unew = np.arange(0, 1.001, resolution)
-        return spi.splev(unew, tck)
+        tck = fit(points)
+        if precision is None:
+            unew = np.arange(0, 1.001, resolution)
+        else:
+            # measure the strongest bending along a coarse sampling
+            coarse = np.transpose(evaluate(tck, points, np.linspace(0, 1, 101)))
+            bend = np.sqrt((np.diff(coarse, 2, axis=0)**2).sum(axis=1)).max()
+            unew = np.union1d(np.linspace(0, 1, samples(bend * 100**2,
+                                                        precision)),
+                              parameters(points))
+        return evaluate(tck, points, unew)
     elif len(points) == 2:
         # throw points on direct line
-        x, y = [], []
-        for i in frange(0.0, 1.001, resolution):
-            x.append(points[0][X] + (points[1][X] - points[0][X]) * i)
-            y.append(points[0][Y] + (points[1][Y] - points[0][Y]) * i)
-        return [np.array(x), np.array(y)]
+        if precision is None:
+            i = frange(0.0, 1.001, resolution)
+        else:
+            # a line is followed exactly by its only chord
+            i = np.array([0.0, 1.0])
+        return evaluate(None, points, i)
     else:
         return None
 
 
+def distinct(points):
+    """ return the given points without the ones which equal their
+        predecessor (points which are all equal become a straight line of
+        zero length between the first and the last one)
+    """
+    keep = np.concatenate(([True], (np.diff(points, axis=0) != 0).any(axis=1)))
+    if keep.all():
+        return points
+    if keep.sum() == 1:
+        return points[[0, -1]]
+    return points[keep]
+
+
+def fit(points, scipy=False):
+    """ fit a quadratic B - Spline through the given points and return its
+        representation (t, c, k) or None if there are only two points which
+        are connected by a straight line. The spline is exactly the one
+        SciPy's splprep(s=0, k=2) fits but is calculated without SciPy
+        unless <scipy> is set to cross-check it.
+    """
+    if len(points) > 2:
+        if scipy:
+            # import SciPy only if really needed
+            from scipy import interpolate as spi
+            tck, u = spi.splprep(points.transpose(), s=0, k=2)
+            return tck
+        u = parameters(points)
+        # interpolating knots of even degree are placed between the points
+        t = np.concatenate(([u[0]] * 3, (u[1:-2] + u[2:-1]) / 2,
+                            [u[-1]] * 3))
+        # solve the coefficients which put the spline through all points
+        l, h = bsplines(t, u)
+        c = solve(l.tolist(), np.transpose(h).tolist(), points.tolist())
+        return [t, [c[:, X], c[:, Y]], 2]
+    return None
+
+
+def solve(l, h, points):
+    """ return the coefficients of the quadratic B - Spline whose B - Splines
+        <h> which are not zero in knot intervals <l> (see bsplines()) are
+        multiplied with them to hit <points>. The rows are rotated into a
+        triangle by Givens transformations and solved by back substitution
+        operation by operation like FITPACK does, so the result is exactly
+        the one of SciPy's splprep().
+    """
+    def rotate(cos, sin, a, b):
+        return cos * a - sin * b, cos * b + sin * a
+    n = len(points)
+    # upper triangle of bandwidth 3 and right hand sides of X and Y
+    a = [[0.0] * 3 for i in range(n)]
+    z = [[0.0] * n for d in (X, Y)]
+    for li, hi, xi in zip(l, h, points):
+        hi, xi = list(hi), list(xi)
+        for i in range(3):
+            j = li - 2 + i
+            piv = hi[i]
+            if piv == 0.0:
+                continue
+            # calculate the Givens transformation like fpgivs() does
+            ww = a[j][0]
+            if abs(piv) >= ww:
+                dd = abs(piv) * math.sqrt(1.0 + (ww / piv) * (ww / piv))
+            else:
+                dd = ww * math.sqrt(1.0 + (piv / ww) * (piv / ww))
+            cos, sin = ww / dd, piv / dd
+            a[j][0] = dd
+            # transform right hand sides and the rest of the row
+            for d in (X, Y):
+                xi[d], z[d][j] = rotate(cos, sin, xi[d], z[d][j])
+            for i1 in range(i + 1, 3):
+                hi[i1], a[j][i1 - i] = rotate(cos, sin, hi[i1], a[j][i1 - i])
+    # backward substitution like fpback() does
+    c = [[0.0] * n for d in (X, Y)]
+    for d in (X, Y):
+        for i in range(n - 1, -1, -1):
+            store = z[d][i]
+            for m in range(1, min(3, n - i)):
+                store = store - c[d][i + m] * a[i][m]
+            c[d][i] = store / a[i][0]
+    return np.transpose(c)
+
+
+def parameters(points):
+    """ return the parameters (0.0..1.0) of the B - Spline fit() puts
+        through the given points which are their accumulated distances
+    """
+    u = np.zeros(len(points))
+    u[1:] = np.cumsum(np.sqrt((np.diff(points, axis=0)**2).sum(axis=1)))
+    return u / u[-1]
+
+
+def evaluate(tck, points, u, scipy=False):
+    """ return the points at the parameters in array <u> (0.0..1.0) of the
+        B - Spline <tck> (see fit()) or of the line between both <points> if
+        <tck> is None. Like fit() uses SciPy's splev() only if <scipy> is set.
+    """
+    if tck is None:
+        return [points[0][X] + (points[1][X] - points[0][X]) * u,
+                points[0][Y] + (points[1][Y] - points[0][Y]) * u]
+    if scipy:
+        # import SciPy only if really needed
+        from scipy import interpolate as spi
+        return spi.splev(u, tck)
+    t, c, k = tck
+    l, h = bsplines(t, u)
+    return [h[0] * v[l - 2] + h[1] * v[l - 1] + h[2] * v[l] for v in c]
+
+
+def bsplines(t, x):
+    """ return the indices of the knot intervals of the quadratic B - Spline
+        with knots <t> the positions in array <x> are in and the values of
+        the three B - Splines which are not zero there
+    """
+    # positions outside the knots are extrapolated by the outer intervals
+    l = np.minimum(np.maximum(np.searchsorted(t, x, side='right') - 1, 2),
+                   len(t) - 4)
+    t0, t1, t2, t3 = t[l - 1], t[l], t[l + 1], t[l + 2]
+    # raise the degree step by step like de Boor's recursion does
+    f = 1.0 / (t2 - t1)
+    h0, h1 = f * (t2 - x), f * (x - t1)
+    f, g = h0 / (t2 - t0), h1 / (t3 - t1)
+    return l, (f * (t2 - x), f * (x - t0) + g * (t3 - x), g * (x - t1))
+
+
+def samples(bend, precision):
+    """ return the number of samples needed to follow a path whose second
+        derivative is <bend> pixels at most by chords which stay within
+        <precision> pixels of it (a chord over a parameter range of d
+        deviates by up to bend * d**2 / 8 from the path)
+    """
+    return max(int(np.ceil(np.sqrt(bend / (8 * precision)))) + 1, 2)
+
+
 def find_nearest(spline, points):
     """ find indices in spline which are most near to the coordinates in points
+        (spline and points may also be arrays of any number of sources which
+        results in an array of indices per source)
     """
-    nearest = []
-    for p in points:
-        # calculation lamba fn
-        distance = (spline[X] - p[X])**2 + (spline[Y] - p[Y])**2
-        # get index of point with the minimum distance
-        idx = np.where(distance == distance.min())
-        nearest.append(idx[0][0])
-    # return nearest points
-    return nearest
+    spline = np.asarray(spline)
+    # calculate distances of all points to all spline points at once
+    distance = ((spline[..., X, np.newaxis, :] - points[..., X, np.newaxis])**2 +
+                (spline[..., Y, np.newaxis, :] - points[..., Y, np.newaxis])**2)
+    # get index of point with the minimum distance
+    return distance.argmin(axis=-1)
 
 
 def measure(points):
     """ measure distances between every given 2D point and the first point
+        (points may also be an array of any number of sources)
     """
-    positions = [(0, 0, 0)]
-    # enumerate between all points
-    for i in range(1, len(points)):
-        # calculate X/Y distances
-        dx = points[i][X] - points[i - 1][X]
-        dy = points[i][Y] - points[i - 1][Y]
-        # calculate movement speed V
-        dv = math.sqrt(dx**2 + dy**2)
-        # sum up to last position
-        dx = positions[-1][X] + abs(dx)
-        dy = positions[-1][Y] + abs(dy)
-        dv = positions[-1][V] + dv
-        # append to result
-        positions.append((dx, dy, dv))
+    # calculate X/Y distances
+    d = np.diff(points, axis=-2)
+    # calculate movement speed V
+    dv = np.sqrt(d[..., X]**2 + d[..., Y]**2)
+    # sum up to positions beginning at zero
+    positions = np.zeros(points.shape[:-1] + (3,))
+    positions[..., 1:, X] = np.cumsum(np.abs(d[..., X]), axis=-1)
+    positions[..., 1:, Y] = np.cumsum(np.abs(d[..., Y]), axis=-1)
+    positions[..., 1:, V] = np.cumsum(dv, axis=-1)
     # return array of distances
     return positions
 
 
 def smooth(x):
     """ smooth value x by using a cosinus wave (0.0 <= x <= 1.0)
+        (x may also be an array of values)
+    """
+    return (-np.cos(np.pi * x) + 1) / 2
+
+
+def linear(x):
+    """ do not ease value x at all (0.0 <= x <= 1.0)
+    """
+    return x
+
+
+def cubic(x):
+    """ smooth value x by using a cubic polynomial which starts and ends
+        like smooth() but needs no trigonometry (0.0 <= x <= 1.0)
+    """
+    return x * x * (3 - 2 * x)
+
+
+def ease_in(x):
+    """ accelerate value x from zero velocity (0.0 <= x <= 1.0)
+    """
+    return x * x
+
+
+def ease_out(x):
+    """ decelerate value x to zero velocity (0.0 <= x <= 1.0)
     """
-    return (-math.cos(math.pi * x) + 1) / 2
+    return x * (2 - x)
+
 
+# easing curves by the names they are configured with. All of them map
+# 0.0..1.0 onto 0.0..1.0 and take arrays of values as well, so they are
+# evaluated once per array and not per frame.
+EASINGS = {"cosine": smooth,
+           "linear": linear,
+           "cubic": cubic,
+           "ease-in": ease_in,
+           "ease-out": ease_out}
 
-def distribute(points, positions, begin, end, x0, x1, n):
-    """ from the sub set given by <points>[<begin>:<end>+1] selects <n> points
-        whose distances are smoothly distributed and returns them.
-        <poisitions> holds a list of distances between all <points> that will
-        be used for smoothing the distribution.
+
+def distribute(points, positions, begin, end, x0, x1, n, ease=smooth,
+               exact=False):
+    """ from the sub sets given by <points>[s, <begin>[s]:<end>[s]+1] of every
+        source s selects <n> points whose distances are distributed along
+        easing curve <ease> and returns them as an array of sources x points.
+        <poisitions> holds the distances between all <points> (see measure())
+        that will be used for smoothing the distribution. If <exact> the
+        points are interpolated between the samples at exactly these
+        distances instead.
     """
     assert type(points) is np.ndarray
-    assert type(positions) is list
-    assert type(begin) is np.int64
-    assert type(end) is np.int64
+    assert type(positions) is np.ndarray
+    assert type(begin) is np.ndarray
+    assert type(end) is np.ndarray
     assert type(x0) is float
     assert type(x1) is float
     assert type(n) is int
-    # calculate overall distance from begin to end
-    length = positions[end - 1][V] - positions[begin][V]
-    # begin result with the first point
-    result = []
-    # check if there is no movement
-    if length == 0.0:
-        for i in range(0, n):
-            result.append(points[begin])
-    else:
-        # calculate start points
-        pos0 = smooth(x0)
-        pos1 = smooth(x1)
-        for i in range(0, n):
-            # calculate current x
-            x = smooth(x0 + ((x1 - x0) / n) * i)
-            # calculate distance on curve from y0 to y
-            pos = (x - pos0) / (pos1 - pos0) * length + positions[begin][V]
-            # find point with that distance
-            for j in range(begin, end):
-                if positions[j][V] >= pos:
-                    # append point to result
-                    result.append(points[j])
-                    break
-    # return result distribution
-    return result
+    if exact:
+        return distribute_exact(points, positions, begin, end, x0, x1, n,
+                                ease)
+    sources = np.arange(len(points))
+    # calculate overall distance from begin to end of every source
+    start = positions[sources, begin, V]
+    length = positions[sources, end - 1, V] - start
+    # calculate start points
+    pos0 = ease(x0)
+    pos1 = ease(x1)
+    # calculate all x
+    x = ease(x0 + ((x1 - x0) / n) * np.arange(max(n, 0)))
+    # calculate distances on curve from y0 to y
+    pos = ((x - pos0) / (pos1 - pos0) * length[:, np.newaxis] +
+           start[:, np.newaxis])
+    # find points with that distances (searchsorted() takes one row only)
+    j = np.array([np.searchsorted(positions[s, begin[s]:end[s], V], pos[s])
+                  for s in sources]).reshape(len(sources), -1)
+    # stay at the begin if there is no movement (or both corners are nearest
+    # to the same point) and before the end otherwise
+    j = np.where(length[:, np.newaxis] <= 0.0, begin[:, np.newaxis],
+                 np.minimum(j + begin[:, np.newaxis], end[:, np.newaxis] - 1))
+    return points[sources[:, np.newaxis], j]
+
+
+def distribute_exact(points, positions, begin, end, x0, x1, n, ease=smooth):
+    """ like distribute() but interpolates the points between the samples
+        (which reach up to <end>[s] here)
+    """
+    sources = np.arange(len(points))
+    # calculate overall distance from begin to end of every source
+    start = positions[sources, begin, V]
+    length = positions[sources, end, V] - start
+    # calculate distances on curve like distribute() does
+    pos0, pos1 = ease(x0), ease(x1)
+    x = ease(x0 + ((x1 - x0) / n) * np.arange(max(n, 0)))
+    pos = ((x - pos0) / (pos1 - pos0) * length[:, np.newaxis] +
+           start[:, np.newaxis])
+    # find the fractional sample indices of these distances
+    j = np.array([np.interp(pos[s], positions[s, begin[s]:end[s] + 1, V],
+                            np.arange(begin[s], end[s] + 1))
+                  for s in sources]).reshape(len(sources), -1)
+    # stay at the begin if there is no movement
+    j = np.where(length[:, np.newaxis] <= 0.0, begin[:, np.newaxis], j)
+    i = np.minimum(np.floor(j).astype(int), len(points[0]) - 2)
+    f = (j - i)[..., np.newaxis]
+    return (points[sources[:, np.newaxis], i] * (1.0 - f) +
+            points[sources[:, np.newaxis], i + 1] * f)
 
 
 def fade(begin, end, factor):
     """ return value within begin and end at < factor > (0.0..1.0)
+        <factor> may also be an array which results in an array of values
     """
     # check if we got a bunch of values to morph
     if type(begin) in [list, tuple]:
@@ -453,9 +1499,15 @@ def fade(begin, end, factor):
         # call fade() for every of these values
         for i in range(len(begin)):
             result.append(fade(begin[i], end[i], factor))
+        if type(factor) is np.ndarray:
+            # turn into one row per factor
+            result = np.array(result).reshape(len(begin), len(factor)).T
     elif type(begin) is int:
         # round result to int if begin is an int
-        result = int(round(begin + (end - begin) * factor))
+        if type(factor) is np.ndarray:
+            result = np.rint(begin + (end - begin) * factor).astype(int)
+        else:
+            result = int(round(begin + (end - begin) * factor))
     else:
         # return the resulting float
         result = begin + (end - begin) * factor
@@ -484,59 +1536,120 @@ def morph(begin, end, pt, corner, factor):
     return result
 
 
-def interpolate(key_frames, num_frames, corner):
+def morphs(begin, end, pts, corners, factors):
+    """ like morph() but interpolates many frames of all sources at once
+        between the frames of every source in 'begin' and 'end' by putting
+        each source's corner given in 'corners' to the points in array 'pts'
+        (sources x frames) at the array of position 'factors'.
+        Returns an array of frames x sources x values (see Animation).
+    """
+    # sizes, croppings and alpha values of all sources
+    b = [list(f.size()) + list(f.crop) + [f.alpha] for f in begin]
+    e = [list(f.size()) + list(f.crop) + [f.alpha] for f in end]
+    # fade all of them at once and round like fade() does if begin is an int
+    ints = np.array([[type(v) is int for v in values] for values in b])
+    b, e = np.array(b, dtype=float), np.array(e, dtype=float)
+    values = b + (e - b) * factors[:, np.newaxis, np.newaxis]
+    values = np.where(ints, np.rint(values), values)
+    size = values[..., :2]
+    # calculate all rectangles
+    pts = pts.transpose(1, 0, 2)
+    left = np.array([c[X] == L for c in corners])
+    top = np.array([c[Y] == T for c in corners])
+    rects = np.stack([np.where(left, pts[..., X], pts[..., X] - size[..., X]),
+                      np.where(top, pts[..., Y], pts[..., Y] - size[..., Y]),
+                      np.where(left, pts[..., X] + size[..., X], pts[..., X]),
+                      np.where(top, pts[..., Y] + size[..., Y], pts[..., Y]),
+                      ], axis=-1)
+    return np.concatenate((rects, values[..., 2:]), axis=-1)
+
+
+def corners(sources, a_corner=(R, T), b_corner=(L, T)):
+    """ return the corners to interpolate the movement of <sources> sources
+        along (<a_corner> for A and <b_corner> for B, C, ...)
+    """
+    return [a_corner] + [b_corner] * (sources - 1)
+
+
+def interpolate(key_frames, num_frames, corner, precision=None, ease=smooth):
     """ interpolate < num_frames > points of one corner defined by < corner >
-        between the rectangles given by < key_frames >
+        between the rectangles given by < key_frames > along easing curve
+        < ease > (see bspline() about < precision >)
+    """
+    return list(iter_interpolate(key_frames, num_frames, corner, precision,
+                                 ease))
+
+
+def iter_interpolate(key_frames, num_frames, corner, precision=None,
+                     ease=smooth):
+    """ like interpolate() but yields the frames one by one
+    """
+    size = key_frames[0].original_size
+    for i, move in enumerate(iter_interpolate_sources(
+            [key_frames], num_frames, [corner], precision, ease)):
+        # yield morphed frames
+        for v in move[:-1, 0].tolist():
+            yield FrozenFrame(v[L:B + 1], [int(x) for x in v[B + 1:B + 5]],
+                              int(v[B + 5]), size)
+        # yield the rectangle from parameters the move ends at
+        yield key_frames[i]
+
+
+def iter_interpolate_sources(key_frames, num_frames, corners, precision=None,
+                             ease=smooth):
+    """ like iter_interpolate() but interpolates all sources at once.
+        < key_frames > holds a list of key frames and < corners > the corner
+        to interpolate for every source. Yields an array of frames x sources
+        x values (see Animation) which only holds the first key frame before
+        any path is fitted and then one per move from one key frame to the
+        next which ends with the values of the next key frame.
     """
+    # values of all key frames (keys x sources x values)
+    values = np.array([[list(f.rect) + list(f.crop) + [f.alpha]
+                        for f in frames] for frames in key_frames],
+                      dtype='<f8').transpose(1, 0, 2)
+    # yield first key frames
+    yield values[:1]
     # get corner points defined by index_x,index_y from rectangles
-    corners = np.array([i.corner(corner[X], corner[Y]) for i in key_frames])
-    # interpolate between corners and get the spline points and the indexes of
-    # those which are the nearest to the corner points
-    spline = bspline(corners)
+    points = [np.array([f.corner(c[X], c[Y]) for f in frames])
+              for frames, c in zip(key_frames, corners)]
+    # interpolate between corners and get the spline points
+    splines = [bspline(p, precision) for p in points]
     # skip if we got no interpolation
-    if not spline:
-        return [], []
-    # find indices of the corner's nearest points within the spline
-    corner_indices = find_nearest(spline, corners)
-    # transpose point array
-    spline = np.transpose(spline)
+    if not splines[0]:
+        return
+    # put all splines into one array of sources x X/Y x samples by repeating
+    # the last point of splines which got less samples (see bspline())
+    n = max(len(spline[X]) for spline in splines)
+    spline = np.array([[np.concatenate((v, np.full(n - len(v), v[-1])))
+                        for v in spline] for spline in splines])
+    # find indices of the corners' nearest points within the splines but
+    # keep the first and last corners at the ends of paths which return to
+    # where they began
+    corner_indices = find_nearest(spline, np.array(points))
+    corner_indices[:, 0] = 0
+    corner_indices[:, -1] = [len(spline[X]) - 1 for spline in splines]
+    # transpose point array into sources x samples x X/Y
+    spline = spline.transpose(0, 2, 1)
     # calulcate number of frames between every corner
-    num_frames_per_move = int(round(num_frames / (len(corner_indices) - 1)))
-    # measure the spline
+    moves = len(key_frames[0]) - 1
+    num_frames_per_move = int(round(num_frames / moves))
+    # measure the splines
     positions = measure(spline)
-    # fill with point animation from corner to corner
-    animation = []
-    for i in range(1, len(corner_indices)):
-        # substitute indices of corner pair
-        begin = corner_indices[i - 1]
-        end = corner_indices[i]
+    # yield point animation from corner to corner
+    for i in range(1, moves + 1):
         # calculate range of X between 0.0 and 1.0 for these corners
-        _x0 = (i - 1) / (len(corner_indices) - 1)
-        _x1 = i / (len(corner_indices) - 1)
+        _x0 = (i - 1) / moves
+        _x1 = i / moves
         # create distribution of points between these corners
         corner_animation = distribute(
-            spline, positions, begin, end, _x0, _x1, num_frames_per_move - 1)
-        # append first rectangle from parameters
-        animation.append(key_frames[i - 1])
-        # cound index
-        for j in range(len(corner_animation)):
-            # calculate current sinus wave acceleration
-            frame = morph(key_frames[i - 1], key_frames[i],
-                          corner_animation[j], corner,
-                          smooth(j / len(corner_animation)))
-            # append to resulting animation
-            animation.append(frame)
-    # append last rectangle from parameters
-    animation.append(key_frames[-1])
-    # return rectangle animation
-    return animation
-
-
-def is_in(sequence, part):
-    """ returns true if 2-item list 'part' is in list 'sequence'
-    """
-    assert len(part) == 2
-    for i in range(0, len(sequence) - 1):
-        if sequence[i: i + 2] == part:
-            return True
-    return False
+            spline, positions, corner_indices[:, i - 1], corner_indices[:, i],
+            _x0, _x1, num_frames_per_move - 1, ease, precision is not None)
+        # calculate current acceleration for all frames
+        factors = ease(np.arange(corner_animation.shape[1]) /
+                       corner_animation.shape[1])
+        # yield morphed frames and next key frames
+        yield np.concatenate((morphs([f[i - 1] for f in key_frames],
+                                     [f[i] for f in key_frames],
+                                     corner_animation, corners, factors),
+                              values[i:i + 1]))